@@ -1,17 +1,99 @@
 # Find a backbone for the polygon by first finding the medial axis and then pruning it to a single linestring
 
+from collections import deque
+
 import numpy as np
-from skimage.morphology import medial_axis
-from networkx import Graph
-from networkx.algorithms.shortest_paths.generic import shortest_path
-from networkx.algorithms.shortest_paths.weighted import (
-    all_pairs_bellman_ford_path_length,
-)
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
+
+# scikit-image, networkx and scipy.ndimage take most of the import time, so
+# they are imported in the functions that use them
+
+from croputils import foreground_bounds, shift_points
+from pointutils import IndexPoint, IndexPointCollection, index_array
+from profiling import stage
+
+# Pixel types used when classifying a skeleton
+BACKGROUND = 0
+ENDPOINT = 1
+PATH = 2
+JUNCTION = 3
+
+# Offsets of the 8 neighbors of a pixel, clockwise starting from the pixel
+# above. Bit k of a neighborhood code is set if neighbor k is foreground.
+_RING_OFFSETS = [(-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1)]
+
+# Correlation kernel that turns a binary image into neighborhood codes
+_RING_WEIGHTS = np.zeros((3, 3), dtype=np.uint8)
+for _k, (_di, _dj) in enumerate(_RING_OFFSETS):
+    _RING_WEIGHTS[_di + 1, _dj + 1] = 1 << _k
+
+
+def _build_lookup_tables():
+    """
+    Tabulate the crossing number and the effective neighbors of every
+    possible 8-neighborhood.
+
+    The crossing number is the number of background-to-foreground
+    transitions when going once around the neighborhood. A diagonal
+    neighbor is effective only if neither of the two edge neighbors next
+    to it is foreground; otherwise it is reached through that edge neighbor.
+    """
+    crossing_number = np.zeros(256, dtype=np.uint8)
+    effective = np.zeros(256, dtype=np.uint8)
+    for code in range(256):
+        bits = [(code >> k) & 1 for k in range(8)]
+        crossing_number[code] = sum(
+            1 for k in range(8) if bits[k - 1] == 0 and bits[k] == 1
+        )
+        effective_code = code
+        for k in range(1, 8, 2):
+            if bits[k] and (bits[k - 1] or bits[(k + 1) % 8]):
+                effective_code &= ~(1 << k)
+        effective[code] = effective_code
+    return crossing_number, effective
+
 
-from pointutils import IndexPointCollection
+# Half-width, in pixels, of the corridor around the upsampled coarse path
+# that is searched on each finer level of the pyramid
+PYRAMID_CORRIDOR = 4
 
 
-def backbone(image):
+def _build_thinning_table():
+    """
+    Tabulate which pixels the medial axis thinning removes, by the code of
+    their 8-neighborhood.
+
+    As in skimage.morphology.medial_axis, a pixel is removed if its
+    foreground neighbors stay 8-connected to each other without it, and if
+    it has at least two of them, so that lines are not shortened.
+    """
+    removable = np.zeros(256, dtype=np.uint8)
+    for code in range(256):
+        neighbors = [_RING_OFFSETS[k] for k in range(8) if (code >> k) & 1]
+        if len(neighbors) < 2:
+            continue
+        # Grow one 8-connected group of neighbors from the first
+        group = {neighbors[0]}
+        grown = True
+        while grown:
+            grown = False
+            for a in neighbors:
+                if a not in group and any(
+                    max(abs(a[0] - b[0]), abs(a[1] - b[1])) == 1 for b in group
+                ):
+                    group.add(a)
+                    grown = True
+        removable[code] = len(group) == len(neighbors)
+    return removable
+
+
+_CROSSING_NUMBER, _EFFECTIVE_NEIGHBORS = _build_lookup_tables()
+_POPCOUNT = np.array([bin(code).count("1") for code in range(256)], dtype=np.uint8)
+_REMOVABLE = _build_thinning_table()
+
+
+def backbone(image, crop=False, levels=1, cache=None):
     """
     Find the backbone of a binary image.
 
@@ -21,49 +103,305 @@ def backbone(image):
         Binary image. Foreground pixels are represented by 1s. Bckground
         pixels are represented by 0s. There should be a contiguous region
         of foreground pixels in the image.
+    crop : bool, optional
+        If True, the medial axis and backbone are found in the bounding box
+        of the foreground, with a margin, instead of the whole image.
+    levels : int, optional
+        Number of levels in the image pyramid. If greater than 1, the
+        backbone is first found on a downsampled image, and then refined on
+        each finer level within a corridor around the coarser backbone.
+    cache : ResultCache, optional
+        Cache for the longest paths along the medial axis.
 
     Returns
     -------
-    backbone : list
-        List of points in the backbone.
+    backbone : ndarray
+        Integer array of shape (N, 2) holding the (i, j) coordinates of the
+        pixels in the backbone.
     """
-    medial = medial_axis(image)
-    i_medial, j_medial = extract_foreground_ij(medial)
+    if crop:
+        bounds = foreground_bounds(image)
+        return shift_points(backbone(image[bounds], levels=levels, cache=cache), bounds)
+
+    with stage("backbone") as counts:
+        if levels > 1:
+            longest_path_points = coarse_to_fine_longest_path(
+                image, levels, cache=cache
+            )
+        else:
+            longest_path_points = longest_medial_path(image, cache=cache)
 
-    graph, segments = create_graph_from_connected_points(i_medial, j_medial)
-    _, longest_path_points = find_longest_path(graph, segments)
+        with stage("extension") as extension_counts:
+            extended_path = extend_to_boundary(longest_path_points, image)
+            if extension_counts is not None:
+                extension_counts["extension_steps"] = len(extended_path) - len(
+                    longest_path_points
+                )
 
-    extended_path = extend_to_boundary(longest_path_points, image)
+        if counts is not None:
+            counts["pixels"] = int(np.size(image))
+            counts["levels"] = levels
+            counts["backbone_pixels"] = len(extended_path)
 
     return extended_path
 
 
-def extract_foreground_ij(image):
+def longest_medial_path(image, mask=None, cache=None, skeleton=None):
     """
-    Find the pixel indices of the foreground of a binary image.
+    Find the longest path along the medial axis of a binary image.
 
     Parameters
     ----------
+    image : ndarray
+        Binary image.
+    mask : ndarray, optional
+        Binary image of the region to search. If given, only the part of the
+        medial axis inside the mask is computed, see corridor_medial_axis,
+        and only the bounding box of the mask is thinned.
+    cache : ResultCache, optional
+        Cache for the longest path.
+    skeleton : ndarray or callable, optional
+        Medial axis of the image, if it is already known, or a function
+        without arguments that returns it. A function is only called if the
+        path is not in the cache. Cannot be combined with a mask.
+
+    Returns
+    -------
+    longest_path_points : ndarray
+        Integer array of shape (N, 2) holding the (i, j) coordinates of the
+        pixels in the longest path.
+    """
+    if skeleton is not None and mask is not None:
+        raise ValueError("A skeleton cannot be combined with a mask")
+
+    if cache is not None:
+        inputs = [np.asarray(image) != 0]
+        if mask is not None:
+            inputs.append(np.asarray(mask) != 0)
+        return cache.get_or_compute(
+            "longest_medial_path",
+            lambda: longest_medial_path(image, mask, skeleton=skeleton),
+            inputs,
+            {"masked": mask is not None},
+        )
+
+    from skimage.morphology import medial_axis
+
+    with stage("medial_axis") as counts:
+        if mask is not None:
+            bounds = foreground_bounds(mask)
+            medial = corridor_medial_axis(image, mask, bounds)
+        elif skeleton is not None:
+            medial = skeleton() if callable(skeleton) else np.asarray(skeleton)
+        else:
+            medial = medial_axis(image)
+        if counts is not None:
+            counts["pixels"] = int(medial.size)
+            counts["skeleton_pixels"] = int(np.count_nonzero(medial))
+
+    with stage("graph") as counts:
+        graph, segments = create_graph_from_skeleton(medial)
+        if counts is not None:
+            counts["nodes"] = graph.number_of_nodes()
+            counts["edges"] = graph.number_of_edges()
+
+    with stage("longest_path") as counts:
+        _, longest_path_points = find_longest_path(graph, segments)
+        if counts is not None:
+            counts["path_pixels"] = len(longest_path_points)
+
+    if mask is not None:
+        longest_path_points = shift_points(longest_path_points, bounds)
+
+    return longest_path_points
+
+
+def corridor_medial_axis(image, corridor, bounds=None):
+    """
+    Compute the medial axis of a binary image within a corridor.
+
+    As in skimage.morphology.medial_axis, the foreground pixels in the
+    corridor are visited once each, in the order of increasing distance
+    from the background, and removed unless that would disconnect their
+    neighbors or shorten a line. The distance is measured to the boundary
+    of the whole image, not of the corridor, so the pixels at the cut edges
+    of the corridor are removed before those on the ridge of the distance,
+    and the result follows the medial axis of the whole image wherever that
+    runs through the corridor. It can differ from it near the ends of the
+    corridor, where the cut edges meet the boundary.
+
+    Parameters
+    ----------
+    image : ndarray
+        Binary image.
+    corridor : ndarray
+        Binary image of the region to thin.
+    bounds : tuple of slice, optional
+        Region of the image that contains the corridor, see
+        croputils.foreground_bounds. Defaults to the whole image.
+
+    Returns
+    -------
     medial : ndarray
-        Medial axis of a binary image.
+        Medial axis within the corridor, cropped to bounds.
+    """
+    from scipy import ndimage
+
+    image = np.asarray(image) != 0
+    if bounds is None:
+        bounds = (slice(0, image.shape[0]), slice(0, image.shape[1]))
+    distance = ndimage.distance_transform_edt(image)[bounds]
+
+    # A margin of background, so that every pixel has 8 neighbors
+    thinned = np.pad(image[bounds] & (np.asarray(corridor)[bounds] != 0), 1)
+    rows, cols = np.nonzero(thinned)
+    codes = ndimage.correlate(
+        thinned.astype(np.uint8), _RING_WEIGHTS, mode="constant", cval=0
+    )
+
+    # Pixels with fewer neighbors, at corners, are visited last among pixels
+    # at the same distance, and the remaining ties are broken at random, as
+    # in raster order whole arms of the medial axis can be eroded
+    tiebreaker = np.random.default_rng(0).permutation(len(rows))
+    order = np.lexsort(
+        (
+            tiebreaker,
+            -_POPCOUNT[codes[rows, cols]].astype(int),
+            distance[rows - 1, cols - 1],
+        )
+    )
+
+    # Offsets of the neighbors in the flattened image, in the order of the
+    # bits of the neighborhood codes
+    width = thinned.shape[1]
+    n, ne, e, se, s, sw, w, nw = [di * width + dj for di, dj in _RING_OFFSETS]
+
+    # The pixels are removed one at a time, each depending on the removals
+    # before it, so the loop runs on plain Python integers
+    flat = bytearray(thinned.astype(np.uint8).tobytes())
+    removable = _REMOVABLE.tobytes()
+    for p in (rows * width + cols)[order].tolist():
+        code = (
+            flat[p + n]
+            | flat[p + ne] << 1
+            | flat[p + e] << 2
+            | flat[p + se] << 3
+            | flat[p + s] << 4
+            | flat[p + sw] << 5
+            | flat[p + w] << 6
+            | flat[p + nw] << 7
+        )
+        if removable[code]:
+            flat[p] = 0
+
+    medial = np.frombuffer(flat, dtype=np.uint8).reshape(thinned.shape)
+    return medial[1:-1, 1:-1] != 0
+
+
+def coarse_to_fine_longest_path(image, levels, corridor=PYRAMID_CORRIDOR, cache=None):
+    """
+    Find the longest path along the medial axis of a binary image with an
+    image pyramid.
+
+    The image is repeatedly downsampled by a factor of two. The longest path
+    is found on the coarsest level, where the medial axis is small. On each
+    finer level, the path is upsampled and only the medial axis within a
+    corridor around it is searched, so most of the spurious skeleton detail
+    is never computed.
+
+    The result is an approximation of longest_medial_path at full
+    resolution. Where the coarse path runs along the same branches, it
+    follows the full-resolution path to within a few pixels, see
+    corridor_medial_axis. But a branch to a small bump of the boundary is
+    smoothed away on the coarse levels, and of two ends that are nearly as
+    far apart, the coarse level may choose the other one, so the path can
+    end in a different branch.
+
+    Parameters
+    ----------
+    image : ndarray
+        Binary image.
+    levels : int
+        Number of levels in the pyramid, including the full-resolution image.
+        Fewer levels are used if the image becomes too small.
+    corridor : int
+        Half-width, in pixels, of the corridor searched on each finer level.
+    cache : ResultCache, optional
+        Cache for the longest path on each level.
 
     Returns
     -------
-    eyes : list
-        List of row indices of the foreground pixels.
-    jays : list
-        List of column indices of the foreground pixels.
+    longest_path_points : ndarray
+        Integer array of shape (N, 2) holding the (i, j) coordinates of the
+        pixels in the longest path at full resolution.
     """
-    # Find the coordinates of the endpoints
-    pixel_indices = np.argwhere(image)
+    from scipy import ndimage
+
+    pyramid = [np.asarray(image) > 0]
+    while len(pyramid) < levels and min(pyramid[-1].shape) >= 2 * (corridor + 1):
+        coarse = downsample_mask(pyramid[-1])
+        if not np.any(coarse):
+            break
+        pyramid.append(coarse)
+
+    path = longest_medial_path(pyramid[-1], cache=cache)
+
+    disk = np.hypot(*np.ogrid[-corridor : corridor + 1, -corridor : corridor + 1])
+    structure = disk <= corridor
+
+    for fine in reversed(pyramid[:-1]):
+        # Mark the 2x2 blocks of fine pixels covered by the coarse path
+        path_mask = np.zeros(fine.shape, dtype=bool)
+        rows, cols = path.T
+        for di in range(2):
+            for dj in range(2):
+                path_mask[
+                    np.minimum(2 * rows + di, fine.shape[0] - 1),
+                    np.minimum(2 * cols + dj, fine.shape[1] - 1),
+                ] = True
+
+        # Grow the path into a corridor, working only in its bounding box
+        bounds = foreground_bounds(path_mask, margin=corridor + 1)
+        corridor_mask = np.zeros(fine.shape, dtype=bool)
+        corridor_mask[bounds] = (
+            ndimage.binary_dilation(path_mask[bounds], structure=structure)
+            & fine[bounds]
+        )
+
+        path = longest_medial_path(fine, mask=corridor_mask, cache=cache)
+
+    return path
+
+
+def downsample_mask(image):
+    """
+    Downsample a binary image by a factor of two.
 
-    # Convert the coordinates to a list of tuples
-    index_tuples = [tuple(coord) for coord in pixel_indices]
+    A pixel in the downsampled image is foreground if at least half of the
+    2x2 block of pixels it covers is foreground.
+    """
+    padded = np.pad(image, [(0, size % 2) for size in image.shape])
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    return blocks.sum(axis=(1, 3)) >= 2
+
+
+def extract_foreground_ij(image):
+    """
+    Find the pixel indices of the foreground of a binary image.
 
-    eyes = [i for (i, j) in index_tuples]
-    jays = [j for (i, j) in index_tuples]
+    Parameters
+    ----------
+    image : ndarray
+        Binary image, e.g. the medial axis of a shape.
 
-    return eyes, jays
+    Returns
+    -------
+    eyes : ndarray
+        Row indices of the foreground pixels, in row-major order.
+    jays : ndarray
+        Column indices of the foreground pixels, in row-major order.
+    """
+    return np.nonzero(image)
 
 
 def create_graph_from_connected_points(eyes, jays):
@@ -91,8 +429,10 @@ def create_graph_from_connected_points(eyes, jays):
     graph : networkx.Graph
         Graph of connected points.
     segments: Dict
-        Dictionary from source nodes to dictionaries from destination nodes to lists of points along the path.
+        Dictionary from source nodes to dictionaries from destination nodes to
+        (N, 2) arrays of the (i, j) coordinates of the points along the path.
     """
+    from networkx import Graph
 
     graph = Graph()
     segments = {}
@@ -101,7 +441,11 @@ def create_graph_from_connected_points(eyes, jays):
     points = IndexPointCollection(eyes, jays)
 
     # Initialize the queue that will hold pairs of starting points and directions
-    queue = []
+    queue = deque()
+
+    # Pairs of node and first step that have already been walked, in either
+    # direction. Each segment is walked only once.
+    walked = set()
 
     # Find starting point
     start_point = points.points[0]
@@ -118,33 +462,267 @@ def create_graph_from_connected_points(eyes, jays):
 
     while queue:
         # Get the next pair of points from the queue
-        previous_point, current_point = queue.pop(0)
+        previous_point, current_point = queue.popleft()
+
+        # Skip segments that have already been walked from the other end
+        if (previous_point, current_point) in walked:
+            continue
 
-        # Walk until a node (endpoint or junction) is encountered
+        # Walk until a node (endpoint, junction or known node) is encountered.
+        # Stopping at known nodes makes the walk end on skeleton loops.
         node_point, entry_point, node_type, distance_walked, segment = (
-            points.walk_to_node(current_point, previous_point)
+            points.walk_to_node(current_point, previous_point, nodes=graph)
+        )
+        walked.add((previous_point, current_point))
+        walked.add((node_point, entry_point))
+
+        # Add the node to the graph, with the neighbors of new junctions
+        # added to the queue
+        if node_point not in graph:
+            graph.add_node(node_point)
+            if node_type == "junction":
+                other_neighbors = points.other_neighbors(node_point, entry_point)
+                for neighbor in other_neighbors:
+                    queue.append((node_point, neighbor))
+
+        # Add the edge to the graph and store the segment
+        _add_segment(
+            graph,
+            segments,
+            previous_point,
+            node_point,
+            distance_walked,
+            index_array(segment),
         )
 
-        # Store the segment
-        if previous_point not in segments:
-            segments[previous_point] = {}
-        segments[previous_point][node_point] = segment
+    return graph, segments
+
+
+def classify_skeleton_pixels(skeleton):
+    """
+    Classify every pixel of a skeleton as background, endpoint, path or junction.
+
+    The classification is done in a single pass over the image, by computing
+    an 8-bit neighborhood code for each pixel and looking it up in tables.
+    Path pixels have a crossing number of 2 and exactly two effective
+    neighbors. Endpoints have a crossing number of at most 1. All other
+    skeleton pixels are junctions.
+
+    Parameters
+    ----------
+    skeleton : ndarray
+        Binary image of a one pixel wide skeleton, e.g. a medial axis.
+
+    Returns
+    -------
+    pixel_types : ndarray
+        Array of the same shape as the skeleton, holding BACKGROUND, ENDPOINT,
+        PATH or JUNCTION for each pixel.
+    neighbor_codes : ndarray
+        Array of the same shape as the skeleton, holding the 8-bit code of
+        the effective neighbors of each skeleton pixel.
+    """
+    from scipy import ndimage
+
+    skeleton = np.asarray(skeleton, dtype=bool)
+    codes = ndimage.correlate(
+        skeleton.astype(np.uint8), _RING_WEIGHTS, mode="constant", cval=0
+    )
+    codes[~skeleton] = 0
+
+    crossing_number = _CROSSING_NUMBER[codes]
+    neighbor_codes = _EFFECTIVE_NEIGHBORS[codes]
+    effective_count = _POPCOUNT[neighbor_codes]
 
-        # Add the node to the graph
-        graph.add_node(node_point)
+    pixel_types = np.full(skeleton.shape, BACKGROUND, dtype=np.uint8)
+    pixel_types[skeleton] = JUNCTION
+    pixel_types[skeleton & (crossing_number <= 1)] = ENDPOINT
+    pixel_types[skeleton & (crossing_number == 2) & (effective_count == 2)] = PATH
 
-        # Add the edge to the graph
-        graph.add_edge(previous_point, node_point, weight=distance_walked)
+    return pixel_types, neighbor_codes
 
-        # If the node is a junction, add the neighbors to the queue
-        if node_type == "junction":
-            other_neighbors = points.other_neighbors(node_point, entry_point)
-            for neighbor in other_neighbors:
-                queue.append((node_point, neighbor))
+
+def create_graph_from_skeleton(skeleton):
+    """
+    Build a graph from a skeleton image using whole-array operations.
+
+    This produces the same kind of graph and segments as
+    create_graph_from_connected_points, but instead of walking the skeleton
+    one pixel at a time, all pixels are classified at once, and the path
+    pixels between nodes are grouped into segments and ordered in bulk.
+
+    Nodes are endpoints and junctions. Closed loops without any node are
+    given a node at their first pixel. If several segments connect the same
+    pair of nodes, the shortest one is kept.
+
+    Parameters
+    ----------
+    skeleton : ndarray
+        Binary image of a one pixel wide skeleton, e.g. a medial axis.
+
+    Returns
+    -------
+    graph : networkx.Graph
+        Graph of connected points.
+    segments: Dict
+        Dictionary from source nodes to dictionaries from destination nodes to
+        (N, 2) arrays of the (i, j) coordinates of the points along the path.
+    """
+    from networkx import Graph
+
+    pixel_types, neighbor_codes = classify_skeleton_pixels(skeleton)
+
+    # Work on padded arrays, so that neighbors can be looked up without
+    # checking the image bounds
+    pixel_types = np.pad(pixel_types, 1)
+    neighbor_codes = np.pad(neighbor_codes, 1)
+
+    eyes, jays = np.nonzero(pixel_types)
+    n_pixels = len(eyes)
+    pixel_index = np.full(pixel_types.shape, -1, dtype=np.intp)
+    pixel_index[eyes, jays] = np.arange(n_pixels)
+    is_node = pixel_types[eyes, jays] != PATH
+    codes = neighbor_codes[eyes, jays]
+
+    # Collect every pair of effectively adjacent pixels once, using the
+    # four neighbors that come after a pixel in row-major order
+    sources, targets, steps = [], [], []
+    for k in range(2, 6):
+        di, dj = _RING_OFFSETS[k]
+        has_neighbor = (codes >> k) & 1 == 1
+        sources.append(np.flatnonzero(has_neighbor))
+        targets.append(pixel_index[eyes[has_neighbor] + di, jays[has_neighbor] + dj])
+        steps.append(np.full(np.count_nonzero(has_neighbor), np.hypot(di, dj)))
+    sources = np.concatenate(sources)
+    targets = np.concatenate(targets)
+    steps = np.concatenate(steps)
+
+    # Group the path pixels into segments. A segment that is a closed loop
+    # has no end, so its first pixel is turned into a node and the grouping
+    # is repeated.
+    while True:
+        is_path_pair = ~is_node[sources] & ~is_node[targets]
+        adjacency = coo_matrix(
+            (
+                np.ones(np.count_nonzero(is_path_pair)),
+                (sources[is_path_pair], targets[is_path_pair]),
+            ),
+            shape=(n_pixels, n_pixels),
+        ).tocsr()
+        adjacency = adjacency + adjacency.T
+        _, labels = connected_components(adjacency, directed=False)
+
+        path_pixels = np.flatnonzero(~is_node)
+        path_labels = labels[path_pixels]
+        is_end = np.diff(adjacency.indptr)[path_pixels] <= 1
+        has_end = np.zeros(n_pixels, dtype=bool)
+        has_end[path_labels[is_end]] = True
+        if np.all(has_end[path_labels]):
+            break
+        loop_labels, first_in_loop = np.unique(path_labels, return_index=True)
+        is_node[path_pixels[first_in_loop[~has_end[loop_labels]]]] = True
+
+    # Order the pixels of every segment from one of its ends, by their
+    # distance along the segment from that end
+    graph = Graph()
+    segments = {}
+    points = [IndexPoint((i - 1, j - 1)) for i, j in zip(eyes.tolist(), jays.tolist())]
+    coordinates = np.column_stack([eyes - 1, jays - 1])
+    graph.add_nodes_from(points[node] for node in np.flatnonzero(is_node).tolist())
+
+    if len(path_pixels) > 0:
+        end_pixels = path_pixels[is_end]
+        _, first_end = np.unique(labels[end_pixels], return_index=True)
+        rank = dijkstra(
+            adjacency, indices=end_pixels[first_end], unweighted=True, min_only=True
+        )
+        order = path_pixels[np.lexsort((rank[path_pixels], path_labels))]
+        segment_ids = np.concatenate(([0], np.cumsum(np.diff(labels[order]) != 0)))
+        starts = np.flatnonzero(np.diff(segment_ids, prepend=-1))
+        stops = np.append(starts[1:], len(order))
+
+        # Length of every segment from its first to its last pixel. When every
+        # segment is a single pixel there are no steps, and np.bincount
+        # returns integers, so the lengths are converted to floats.
+        within = np.diff(segment_ids) == 0
+        step_lengths = np.hypot(np.diff(eyes[order]), np.diff(jays[order]))
+        lengths = np.bincount(
+            segment_ids[1:][within],
+            weights=step_lengths[within],
+            minlength=len(starts),
+        ).astype(float)
+
+        # Find the node at either end of every segment. A segment of a single
+        # pixel has two node neighbors, one for each end.
+        is_attachment = is_node[sources] != is_node[targets]
+        attached_path = np.where(is_node[sources], targets, sources)[is_attachment]
+        attached_node = np.where(is_node[sources], sources, targets)[is_attachment]
+        attached_step = steps[is_attachment]
+        by_path = np.argsort(attached_path, kind="stable")
+        attached_path = attached_path[by_path]
+        attached_node = attached_node[by_path]
+        attached_step = attached_step[by_path]
+        first_attachment = np.searchsorted(attached_path, order[starts], side="left")
+        last_attachment = (
+            np.searchsorted(attached_path, order[stops - 1], side="right") - 1
+        )
+        lengths += attached_step[first_attachment] + attached_step[last_attachment]
+
+        # Put the end nodes around the pixels of every segment, and split the
+        # coordinates of all segments at once. Insertions at the same place
+        # keep their order, so the end of one segment comes before the start
+        # of the next.
+        src_nodes = attached_node[first_attachment]
+        dst_nodes = attached_node[last_attachment]
+        with_nodes = np.insert(
+            order,
+            np.column_stack([starts, stops]).ravel(),
+            np.column_stack([src_nodes, dst_nodes]).ravel(),
+        )
+        segment_coordinates = np.split(
+            coordinates[with_nodes], stops[:-1] + 2 * np.arange(1, len(stops))
+        )
+
+        for src, dst, length, segment in zip(
+            src_nodes.tolist(),
+            dst_nodes.tolist(),
+            lengths.tolist(),
+            segment_coordinates,
+        ):
+            _add_segment(graph, segments, points[src], points[dst], length, segment)
+
+    # Nodes that are next to each other are connected directly
+    is_node_pair = is_node[sources] & is_node[targets]
+    for src, dst, step in zip(
+        sources[is_node_pair].tolist(),
+        targets[is_node_pair].tolist(),
+        steps[is_node_pair].tolist(),
+    ):
+        segment = coordinates[[src, dst]]
+        _add_segment(graph, segments, points[src], points[dst], step, segment)
 
     return graph, segments
 
 
+def _add_segment(graph, segments, src, dst, weight, segment):
+    """
+    Add a segment to the graph, unless a shorter one between the same nodes
+    is already present.
+    """
+    if graph.has_edge(src, dst):
+        if graph[src][dst]["weight"] <= weight:
+            return
+        if dst in segments.get(src, {}):
+            del segments[src][dst]
+        else:
+            del segments[dst][src]
+
+    if src not in segments:
+        segments[src] = {}
+    segments[src][dst] = segment
+    graph.add_edge(src, dst, weight=weight)
+
+
 def find_longest_path(graph, segments):
     """
     Find the longest path in the graph.
@@ -154,60 +732,171 @@ def find_longest_path(graph, segments):
     graph : networkx.Graph
         Graph of connected points.
     segments: Dict
-        Dictionary from source nodes to dictionaries from destination nodes to lists of points along the path.
+        Dictionary from source nodes to dictionaries from destination nodes to
+        (N, 2) arrays of the (i, j) coordinates of the points along the path.
 
     Returns
     -------
     longest_path_nodes : list
         List of nodes in the longest path.
-    longest_path_points: list
-        List of points in the longest path.
-    """
-    # Compute pairwise shortest distances between all nodes in the graph
-    distances = dict(all_pairs_bellman_ford_path_length(graph, weight="weight"))
-
-    # Find the longest path
-    longest_distance = 0
-    longest_path_src_dst = []
-
-    for src, dstlist in distances.items():
-        for dst, distance in dstlist.items():
-            if distance > longest_distance:
-                longest_distance = distance
-                longest_path_src_dst = [src, dst]
-
-    # Find the longest path
-    longest_path_nodes = list(
-        shortest_path(
-            graph, source=longest_path_src_dst[0], target=longest_path_src_dst[1]
-        )
-    )
+    longest_path_points: ndarray
+        Integer array of shape (N, 2) holding the (i, j) coordinates of the
+        points in the longest path.
+    """
+    # Convert the graph to a compressed sparse graph. Self-loops never lie
+    # on a shortest path, so they are left out.
+    nodes = list(graph.nodes)
+    node_index = {node: k for k, node in enumerate(nodes)}
+    edges = [
+        (node_index[u], node_index[v], weight)
+        for u, v, weight in graph.edges(data="weight")
+        if u != v
+    ]
+    if not edges:
+        raise ValueError("The graph must contain at least one edge")
+    sources, targets, weights = zip(*edges)
+    sparse_graph = coo_matrix(
+        (weights, (sources, targets)), shape=(len(nodes), len(nodes))
+    ).tocsr()
+    longest_path_nodes = [
+        nodes[k] for k in longest_path_indices(sparse_graph, len(edges))
+    ]
 
     # Find the points in the longest path
-    longest_path_points = []
+    path_segments = []
 
     for i in range(len(longest_path_nodes) - 1):
         start_node = longest_path_nodes[i]
         end_node = longest_path_nodes[i + 1]
         if start_node in segments and end_node in segments[start_node]:
-            longest_path_points.extend(segments[start_node][end_node])
+            path_segments.append(segments[start_node][end_node])
         elif end_node in segments and start_node in segments[end_node]:
-            longest_path_points.extend(segments[end_node][start_node][::-1])
+            path_segments.append(segments[end_node][start_node][::-1])
         else:
             raise ValueError("No segment found between nodes")
 
+    longest_path_points = np.concatenate(path_segments).astype(np.intp, copy=False)
+
     return longest_path_nodes, longest_path_points
 
 
+def longest_path_indices(sparse_graph, n_edges):
+    """
+    Find the longest of the shortest paths between the nodes of a graph.
+
+    Parameters
+    ----------
+    sparse_graph : scipy.sparse.csr_matrix
+        Adjacency matrix of an undirected graph, with the length of every
+        edge stored once.
+    n_edges : int
+        Number of edges in the graph. If the graph is a forest, its
+        diameter is found with two sweeps instead of all pairs of nodes.
+
+    Returns
+    -------
+    path : list
+        Indices of the nodes on the path. The path starts at the end from
+        which its length, added up edge by edge, is largest, and on a tie at
+        the end with the lower index. The two sums can differ in the last
+        bit, and this is the end that the all-pairs search of
+        find_longest_path used to start from.
+    """
+    n_components, labels = connected_components(sparse_graph, directed=False)
+
+    # Find the two most distant nodes, and the shortest path between them
+    if n_edges == sparse_graph.shape[0] - n_components:
+        src, dst, predecessors = _tree_diameter(sparse_graph, labels)
+    else:
+        src, dst, predecessors = _graph_diameter(sparse_graph)
+
+    path = [dst]
+    while path[-1] != src:
+        path.append(int(predecessors[path[-1]]))
+
+    # Orient the path as the all-pairs search did, which took the pair whose
+    # length, summed from its first node, was strictly the largest
+    symmetric = sparse_graph + sparse_graph.T
+    weights = np.asarray(symmetric[path[:-1], path[1:]]).ravel()
+    forward = np.cumsum(weights)[-1] if len(weights) else 0.0
+    backward = np.cumsum(weights[::-1])[-1] if len(weights) else 0.0
+    if (forward, -path[0]) < (backward, -path[-1]):
+        path.reverse()
+    return path
+
+
+def _tree_diameter(sparse_graph, labels):
+    """
+    Find the two most distant nodes of a forest with two sweeps.
+
+    In a tree, the node farthest from any node is one end of a longest
+    path. A second sweep from that node finds the other end. Both sweeps
+    cover all trees in the forest at once.
+
+    Returns the source and destination node indices of the longest path,
+    and the predecessors of the nodes on the path.
+    """
+    _, roots = np.unique(labels, return_index=True)
+    distances = dijkstra(sparse_graph, directed=False, indices=roots, min_only=True)
+
+    # The farthest node from the root of each tree
+    by_tree = np.lexsort((distances, labels))
+    last_in_tree = np.append(np.flatnonzero(np.diff(labels[by_tree])), len(labels) - 1)
+    farthest = by_tree[last_in_tree]
+
+    distances, predecessors, sources = dijkstra(
+        sparse_graph,
+        directed=False,
+        indices=farthest,
+        min_only=True,
+        return_predecessors=True,
+    )
+    dst = int(np.argmax(distances))
+
+    return int(sources[dst]), dst, predecessors
+
+
+def _graph_diameter(sparse_graph, chunk_size=256):
+    """
+    Find the two most distant nodes of a graph that may contain cycles.
+
+    Shortest distances are computed from all nodes, a bounded number of
+    source nodes at a time, so that the full distance matrix is never held
+    in memory.
+
+    Returns the source and destination node indices of the longest path,
+    and the predecessors of the nodes on the path.
+    """
+    n_nodes = sparse_graph.shape[0]
+    longest_distance = -1.0
+    src, dst = 0, 0
+
+    for start in range(0, n_nodes, chunk_size):
+        indices = np.arange(start, min(start + chunk_size, n_nodes))
+        distances = dijkstra(sparse_graph, directed=False, indices=indices)
+        distances[np.isinf(distances)] = -1.0
+        row, col = np.unravel_index(np.argmax(distances), distances.shape)
+        if distances[row, col] > longest_distance:
+            longest_distance = distances[row, col]
+            src, dst = int(indices[row]), int(col)
+
+    _, predecessors = dijkstra(
+        sparse_graph, directed=False, indices=src, return_predecessors=True
+    )
+
+    return src, dst, predecessors
+
+
 def extend_to_boundary(path, image, k=10):
     """
     Extend the path to the edge of the foreground region in the image.
 
     Parameters
     ----------
-    path : list
-        List of IndexPoints in the path. The path is assumed to lie inside the
-        foreground region of the image.
+    path : ndarray or sequence
+        Array of shape (N, 2) holding the (i, j) coordinates of the points in
+        the path, or sequence of (i, j) tuples or IndexPoints. The path is
+        assumed to lie inside the foreground region of the image.
     image : ndarray
         Binary image. Foreground pixels are represented by 1s. Bckground
         pixels are represented by 0s. There should be a contiguous region
@@ -218,125 +907,171 @@ def extend_to_boundary(path, image, k=10):
 
     Returns
     -------
-    extended_path : list
-        List of points in the extended path. The order of the pixels in the
-        original path is preserved.
+    extended_path : ndarray
+        Integer array of shape (N, 2) holding the (i, j) coordinates of the
+        points in the extended path. The order of the pixels in the original
+        path is preserved. Pixels at either end that touch the foreground
+        only by their corners are left out.
     """
+    path_array = index_array(path)
 
-    # Convert path from IndexPoints to tuples
-    path = [(point._row_index, point._col_index) for point in path]
+    # Use the first k points in the path, in reverse, to find the extension
+    # backward from the start of the path, and the last k points to find the
+    # extension forward from the end of the path
+    first_k_points = path_array[:k][::-1]
+    last_k_points = path_array[-k:]
 
-    # Get the first k points in the path and Find the extension backward from the start of the path
-    first_k_points = path[:k]
-    first_k_points.reverse()
-    start_extension = extend_locally(first_k_points, image)
-    start_extension.reverse()
-
-    # Get the last k points in the path and Find the extension forward from the end of the path
-    last_k_points = path[-k:]
-    end_extension = extend_locally(last_k_points, image)
+    origins = np.array([first_k_points[-1], last_k_points[-1]])
+    directions = np.array(
+        [extension_direction(first_k_points), extension_direction(last_k_points)]
+    )
+    start_extension, end_extension = extend_along_rays(origins, directions, image)
 
     # Assemble the extended path
-    extended_path = start_extension + path + end_extension
+    extended_path = np.concatenate([start_extension[::-1], path_array, end_extension])
 
-    return extended_path
+    # The medial axis can run into a pixel that touches the rest of the
+    # foreground only by a corner
+    return trim_corner_ends(extended_path, image)
 
 
-def extend_locally(path, image):
+def trim_corner_ends(path, image):
     """
-    Extend a path locally to the edge of the foreground region in the image.
+    Remove the pixels at either end of a path that touch the foreground of
+    an image only by their corners.
+
+    The fast marching method cannot march from such a pixel, so the ends of
+    a backbone must not be one.
 
     Parameters
     ----------
-    path : list
-        List of points in the path. The path is assumed to lie inside the
-        foreground region of the image. This should be a short, relatively
-        straight segment of the path, with a consistent direction.
+    path : ndarray
+        Integer array of shape (N, 2) holding the (i, j) coordinates of the
+        pixels in the path.
     image : ndarray
-        Binary image. Foreground pixels are represented by 1s. Bckground
-        pixels are represented by 0s. There should be a contiguous region
-        of foreground pixels around the path.
+        Binary image.
 
     Returns
     -------
-    extension : list
-        List of points in the extension. The extension does not include
-        the points in the original path.
-    """
-
-    # Identify the last point in the path. Then, for all other points
-    # in the path, compute the normalized displacement vector from
-    # the last point. Use the negative average displacement vector as
-    # the direction of the extension.
-    last_point = path[-1]
-    displacements = []
-    for point in path[:-1]:
-        displacement = (point[0] - last_point[0], point[1] - last_point[1])
-        norm = np.linalg.norm(displacement)
-        displacements.append((displacement[0] / norm, displacement[1] / norm))
-
-    direction = np.mean(displacements, axis=0) * -1
-
-    # Place integer-coordinate points that are close to the line
-    # and next to already-placed points until the boundary of the
-    # foreground region is reached.
-
-    boundary_reached = False
-    current_point = last_point
-    extension = []
-
-    while not boundary_reached:
-        # Find the neighbors of the current point
-        neighbors = [
-            (current_point[0] + i, current_point[1] + j)
-            for i in range(-1, 2)
-            for j in range(-1, 2)
-            if (i, j) != (0, 0)
-        ]
-
-        # Filter out neighbors that are outside the image
-        neighbors = [
-            neighbor
-            for neighbor in neighbors
-            if 0 <= neighbor[0] < image.shape[0] and 0 <= neighbor[1] < image.shape[1]
-        ]
-
-        neighbor_cosines_last = []
-        good_neighbors = []
-        for neighbor in neighbors:
-            displacement_current = (
-                neighbor[0] - current_point[0],
-                neighbor[1] - current_point[1],
-            )
-            norm_current = np.linalg.norm(displacement_current)
-            cosine_current = np.dot(displacement_current, direction) / norm_current
+    trimmed_path : ndarray
+        The path without those pixels at its ends, or the whole path if
+        none of its pixels has a foreground 4-neighbor.
+    """
+    path = index_array(path)
+    usable = _has_edge_neighbor(image, path[:, 0], path[:, 1])
+    if not np.any(usable):
+        return path
+    first = np.argmax(usable)
+    last = len(usable) - np.argmax(usable[::-1])
+    return path[first:last]
 
-            if cosine_current > 0:
-                displacement_last = (
-                    neighbor[0] - last_point[0],
-                    neighbor[1] - last_point[1],
-                )
-                norm_last = np.linalg.norm(displacement_last)
-                cosine_last = np.dot(displacement_last, direction) / norm_last
-                neighbor_cosines_last.append(cosine_last)
-                good_neighbors.append(neighbor)
 
-        # Choose the neighbor with the largest cosine
-        best_neighbor = good_neighbors[np.argmax(neighbor_cosines_last)]
+def _has_edge_neighbor(image, rows, cols):
+    """
+    Check which of the given pixels have at least one foreground pixel among
+    their 4 neighbors.
+    """
+    padded = np.pad(np.asarray(image) != 0, 1)
+    rows, cols = rows + 1, cols + 1
+    return (
+        padded[rows - 1, cols]
+        | padded[rows + 1, cols]
+        | padded[rows, cols - 1]
+        | padded[rows, cols + 1]
+    )
+
 
-        # Add the best neighbor to the extension
-        extension.append(best_neighbor)
+def extension_direction(path):
+    """
+    Estimate the direction in which a path leaves its last point.
+
+    Parameters
+    ----------
+    path : ndarray
+        Array of shape (N, 2) holding the (i, j) coordinates of the points in
+        the path. This should be a short, relatively straight segment of the
+        path, with a consistent direction.
+
+    Returns
+    -------
+    direction : ndarray
+        The negative average of the unit vectors from the last point to the
+        other points. Points that coincide with the last point are ignored.
+    """
+    displacements = path[:-1] - path[-1]
+    norms = np.hypot(displacements[:, 0], displacements[:, 1])
+    displacements = displacements[norms > 0] / norms[norms > 0, np.newaxis]
+
+    if len(displacements) == 0:
+        return np.zeros(2)
+
+    return -displacements.mean(axis=0)
+
+
+def extend_along_rays(origins, directions, image):
+    """
+    Extend paths along straight rays to the edge of the foreground region.
+
+    Each ray is rasterized as an 8-connected line from its origin, and the
+    pixels on all rays are looked up at once. A ray stops at the first
+    background pixel, or at the image border if the foreground reaches it.
+    It also stops at a foreground pixel none of whose 4 neighbors is
+    foreground, which the ray can only reach by a diagonal step, because the
+    fast marching method cannot march from such a pixel.
+
+    Parameters
+    ----------
+    origins : ndarray
+        Array of shape (N, 2) holding the (i, j) coordinates of the start of
+        each ray. The origins are assumed to lie inside the foreground region.
+    directions : ndarray
+        Array of shape (N, 2) holding the direction of each ray.
+    image : ndarray
+        Binary image. Foreground pixels are represented by 1s. Bckground
+        pixels are represented by 0s.
 
-        # Update the current point
-        current_point = best_neighbor
+    Returns
+    -------
+    extensions : list
+        List of N integer arrays of shape (M, 2) holding the (i, j)
+        coordinates of the points in the extensions. The extensions do not
+        include the origins. The first pixel of each ray is left out, and so
+        is the background pixel where the ray stops. This is required if we
+        want to use the extended backbone as a seed set for the FMM distance
+        transform.
+    """
+    origins = np.asarray(origins, dtype=float).reshape(-1, 2)
+    directions = np.asarray(directions, dtype=float).reshape(-1, 2)
+
+    # Scale the directions so that every step moves exactly one pixel
+    # along the major axis of the ray
+    major = np.abs(directions).max(axis=1)
+    has_direction = major > 0
+    steps = np.zeros_like(directions)
+    steps[has_direction] = directions[has_direction] / major[has_direction, np.newaxis]
+
+    # Rasterize the rays, long enough to leave the image
+    t = np.arange(1, sum(image.shape) + 1)
+    rows = np.floor(origins[:, [0]] + t * steps[:, [0]] + 0.5).astype(np.intp)
+    cols = np.floor(origins[:, [1]] + t * steps[:, [1]] + 0.5).astype(np.intp)
+
+    inside = (
+        (rows >= 0) & (rows < image.shape[0]) & (cols >= 0) & (cols < image.shape[1])
+    )
+    foreground = np.zeros(rows.shape, dtype=bool)
+    foreground[inside] = image[rows[inside], cols[inside]] != 0
 
-        # Check if the current point is on the boundary
-        if image[current_point] == 0:
-            boundary_reached = True
+    # Foreground pixels connected to the rest of the foreground only by
+    # their corners
+    foreground[foreground] = _has_edge_neighbor(
+        image, rows[foreground], cols[foreground]
+    )
 
-    # Prune the first and last points of the extension.
-    # This is required if we want to use the extended backbone
-    # as a seed set for the FMM distance transform.
-    extension = extension[1:-1]
+    # Index of the first pixel on each ray that is background or outside
+    stops = np.argmax(~foreground, axis=1)
 
-    return extension
+    stops[~has_direction] = 1
+    return [
+        np.column_stack([ray_rows[1:stop], ray_cols[1:stop]])
+        for ray_rows, ray_cols, stop in zip(rows, cols, stops)
+    ]
@@ -0,0 +1,300 @@
+# Compute the backbone, distance fields and intra-body location parameters of every feature in a shapefile
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+
+from intrabody import intrabody_fields_by_component, to_fixed_point
+from rasterize import grid_from_bounds, rasterize
+from resultcache import CACHE_SIZE, ResultCache
+
+# Floating point type of the fields for each storage precision. With
+# "uint16", the distality and peripherality are stored as fixed point
+# numbers, see intrabody.to_fixed_point.
+PRECISIONS = {"float64": np.float64, "float32": np.float32, "uint16": np.float32}
+FIXED_POINT_FIELDS = ("distality", "peripherality")
+
+
+def process_feature(
+    feature_id,
+    geometry,
+    output_dir,
+    nrows,
+    ncols,
+    supersample=1,
+    precision="float64",
+    cache=None,
+):
+    """
+    Compute and store the fields of a single feature.
+
+    The fields are written to <feature_id>.npz and the summary statistics
+    to <feature_id>.json. The summary is written last, so its presence
+    marks the feature as done. The fields are computed and stored with the
+    given precision, one of the keys of PRECISIONS. If a ResultCache is
+    given, the backbones and distance fields are looked up in it first.
+
+    Returns
+    -------
+    summary : dict
+        Summary statistics of the feature.
+    """
+    start_time = time.perf_counter()
+
+    grid = grid_from_bounds(geometry.bounds, nrows, ncols)
+    is_inside = rasterize(geometry, grid, supersample=supersample)
+    arrays, summary = image_results(is_inside, precision=precision, cache=cache)
+    arrays["bounds"] = np.array(geometry.bounds)
+    summary = {
+        "feature_id": feature_id,
+        **summary,
+        "seconds": time.perf_counter() - start_time,
+    }
+    write_results(output_dir, feature_id, arrays, summary)
+
+    return summary
+
+
+def image_results(image, precision="float64", cache=None):
+    """
+    Compute the fields of every component of a binary image, and their
+    summary statistics.
+
+    Parameters
+    ----------
+    image : ndarray
+        Binary image.
+    precision : str, optional
+        Storage precision, one of the keys of PRECISIONS.
+    cache : ResultCache, optional
+        Cache for the backbones and distance fields.
+
+    Returns
+    -------
+    arrays : dict
+        Arrays to store: the image, the component labels, one backbone per
+        component and the fields, with missing values as NaN.
+    summary : dict
+        Summary statistics of the fields.
+    """
+    fields = intrabody_fields_by_component(
+        image, max_workers=1, dtype=PRECISIONS[precision], cache=cache
+    )
+
+    arrays = {"image": image, "labels": fields.labels}
+    for k, backbone_pixels in enumerate(fields.backbones):
+        arrays[f"backbone_{k}"] = backbone_pixels
+    for name in fields._fields[2:]:
+        field = getattr(fields, name)
+        if precision == "uint16" and name in FIXED_POINT_FIELDS:
+            arrays[name] = to_fixed_point(field)
+        else:
+            arrays[name] = np.ma.filled(field, np.nan)
+
+    summary = {
+        "precision": precision,
+        "pixels": int(np.count_nonzero(image)),
+        "components": len(fields.backbones),
+        "backbone_pixels": [
+            len(backbone_pixels) for backbone_pixels in fields.backbones
+        ],
+        "mean_distality": _masked_statistic(np.ma.mean, fields.distality),
+        "mean_peripherality": _masked_statistic(np.ma.mean, fields.peripherality),
+        "median_distality": _masked_statistic(np.ma.median, fields.distality),
+        "median_peripherality": _masked_statistic(np.ma.median, fields.peripherality),
+        "max_distance_from_edge": _masked_statistic(
+            np.ma.max, fields.distance_from_edge
+        ),
+    }
+    return arrays, summary
+
+
+def write_results(output_dir, name, arrays, summary):
+    """
+    Write the arrays to <name>.npz and the summary to <name>.json in the
+    output directory. The name may contain subdirectories. The summary is
+    written last, so its presence marks the results as complete.
+    """
+    output_dir = Path(output_dir)
+    (output_dir / name).parent.mkdir(parents=True, exist_ok=True)
+    _write_atomically(
+        output_dir / f"{name}.npz", lambda f: np.savez_compressed(f, **arrays)
+    )
+    _write_atomically(
+        output_dir / f"{name}.json",
+        lambda f: f.write(json.dumps(summary, indent=2).encode()),
+    )
+
+
+def _masked_statistic(statistic, values):
+    """
+    Apply a statistic to the valid values of a masked array, or return None
+    if there are none.
+    """
+    values = np.ma.masked_invalid(values)
+    if values.count() == 0:
+        return None
+    return float(statistic(values))
+
+
+def _write_atomically(path, write):
+    """
+    Write a file through a temporary file, so that a run that is interrupted
+    never leaves a partially written file behind. The temporary file is
+    named after the process, so that workers never write to the same one.
+    """
+    temporary_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(temporary_path, "wb") as f:
+        write(f)
+    os.replace(temporary_path, path)
+
+
+def feature_ids(names):
+    """
+    Make a file name for every feature from its position and name.
+    """
+    return [
+        f"{index:05d}_{re.sub(r'[^A-Za-z0-9]+', '_', str(name)).strip('_')}"
+        for index, name in enumerate(names)
+    ]
+
+
+def main(
+    shapefile,
+    output_dir,
+    name_field="NAME",
+    nrows=128,
+    ncols=128,
+    supersample=1,
+    max_workers=None,
+    precision="float64",
+    cache_dir=None,
+    cache_size=CACHE_SIZE,
+):
+    output_dir = Path(output_dir)
+    cache = ResultCache(cache_dir, cache_size) if cache_dir is not None else None
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Read the layer once, and skip the features that are already done
+    layer = gpd.read_file(shapefile)
+    ids = feature_ids(layer[name_field])
+    pending = [
+        (feature_id, geometry)
+        for feature_id, geometry in zip(ids, layer.geometry)
+        if not (output_dir / f"{feature_id}.json").exists()
+    ]
+    print(f"{len(ids) - len(pending)} of {len(ids)} features already done")
+
+    start_time = time.perf_counter()
+    failed = []
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                process_feature,
+                feature_id,
+                geometry,
+                output_dir,
+                nrows,
+                ncols,
+                supersample,
+                precision,
+                cache,
+            ): feature_id
+            for feature_id, geometry in pending
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            feature_id = futures[future]
+            try:
+                summary = future.result()
+                print(
+                    f"[{done}/{len(pending)}] {feature_id}: {summary['seconds']:.2f} s"
+                )
+            except Exception as exc:
+                failed.append(feature_id)
+                print(f"[{done}/{len(pending)}] {feature_id}: failed ({exc})")
+
+    elapsed = time.perf_counter() - start_time
+    processed = len(pending) - len(failed)
+    print(
+        f"Processed {processed} features in {elapsed:.1f} s "
+        f"({processed / elapsed if elapsed > 0 else 0:.2f} features/s), {len(failed)} failed"
+    )
+
+    # Collect the summaries of all completed features
+    with open(output_dir / "summary.jsonl", "w") as f:
+        for feature_id in ids:
+            summary_path = output_dir / f"{feature_id}.json"
+            if summary_path.exists():
+                f.write(json.dumps(json.loads(summary_path.read_text())) + "\n")
+
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compute intra-body location parameters for every feature in a shapefile."
+        " Features that are already done in the output directory are skipped."
+    )
+    parser.add_argument("shapefile", help="Path to the shapefile")
+    parser.add_argument("output_dir", help="Directory to write the results to")
+    parser.add_argument(
+        "--name-field", default="NAME", help="Attribute used to name the output files"
+    )
+    parser.add_argument(
+        "--rows", type=int, default=128, help="Number of rows in the raster"
+    )
+    parser.add_argument(
+        "--cols", type=int, default=128, help="Number of columns in the raster"
+    )
+    parser.add_argument(
+        "--supersample",
+        type=int,
+        default=1,
+        help="Number of samples per pixel along each axis when rasterizing",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=sorted(PRECISIONS),
+        default="float64",
+        help="Precision of the stored fields. uint16 stores the distality and"
+        " peripherality as fixed point numbers, and the distances as float32",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Directory of a cache for the backbones and distance fields,"
+        " shared by all workers and reused between runs",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=CACHE_SIZE // 2**20,
+        help="Size budget of the cache in MiB",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of worker processes"
+    )
+    args = parser.parse_args()
+
+    failed = main(
+        args.shapefile,
+        args.output_dir,
+        name_field=args.name_field,
+        nrows=args.rows,
+        ncols=args.cols,
+        supersample=args.supersample,
+        max_workers=args.workers,
+        precision=args.precision,
+        cache_dir=args.cache_dir,
+        cache_size=args.cache_size * 2**20,
+    )
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,102 @@
+# Compare the speed and accuracy of the distance engines at several image sizes
+
+import argparse
+import time
+
+import geopandas as gpd
+import numpy as np
+
+from backbone import backbone
+from fmmdistance import distance_from_edge, distance_from_seed_set
+from rasterize import grid_from_bounds, rasterize
+
+EDGE_ENGINES = ["fmm", "edt"]
+SEED_SET_ENGINES = ["fmm", "graph"]
+
+
+def best_time(function, repeat):
+    """
+    Run a function several times, and return its result and the shortest
+    run time in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start_time)
+    return result, min(times)
+
+
+def relative_error(values, reference):
+    """
+    Largest difference from the reference, relative to the largest
+    reference value, over the pixels where both are defined.
+    """
+    difference = np.ma.masked_invalid(np.ma.abs(values - reference))
+    return float(difference.max() / np.ma.abs(reference).max())
+
+
+def benchmark(image, repeat):
+    """
+    Time every engine on one image, and compare it to the fast marching
+    method.
+
+    Returns
+    -------
+    rows : list of tuples
+        (field, engine, seconds, relative error) for every engine.
+    """
+    backbone_pixels = backbone(image)
+    seed_sets = {
+        "distance_from_edge": None,
+        "distance_from_backbone": backbone_pixels,
+        "distance_from_proximal": backbone_pixels[:1],
+    }
+
+    rows = []
+    for field, seed_set in seed_sets.items():
+        if seed_set is None:
+            engines = EDGE_ENGINES
+            compute = lambda engine: distance_from_edge(image, engine=engine)
+        else:
+            engines = SEED_SET_ENGINES
+            compute = lambda engine: distance_from_seed_set(
+                image, seed_set, engine=engine
+            )
+
+        reference = None
+        for engine in engines:
+            distance, seconds = best_time(lambda: compute(engine), repeat)
+            if reference is None:
+                reference = distance
+            rows.append((field, engine, seconds, relative_error(distance, reference)))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the distance engines on a rasterized country"
+    )
+    parser.add_argument("country", nargs="?", default="Brazil", help="Country name")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[128, 256, 512, 1024, 2048],
+        help="Numbers of rows and columns of the rasters",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Number of runs of every engine"
+    )
+    args = parser.parse_args()
+
+    world = gpd.read_file(
+        "data/ne_110m_admin_0_countries/ne_110m_admin_0_countries.shp"
+    )
+    geometry = world.loc[world.NAME == args.country].geometry.iloc[0]
+
+    print(f"{'size':>6} {'field':<24} {'engine':<6} {'seconds':>9} {'rel. error':>10}")
+    for size in args.sizes:
+        image = rasterize(geometry, grid_from_bounds(geometry.bounds, size, size))
+        for field, engine, seconds, error in benchmark(image, args.repeat):
+            print(f"{size:>6} {field:<24} {engine:<6} {seconds:>9.4f} {error:>10.4f}")
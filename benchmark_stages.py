@@ -0,0 +1,182 @@
+# Time every stage of the computation of the intra-body location parameters, and write the times to a JSON lines file
+
+import argparse
+import json
+import platform
+import subprocess
+import time
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from shapely import affinity
+from skimage.io import imread
+from skimage.morphology import medial_axis
+
+from backbone import create_graph_from_skeleton, extend_to_boundary, find_longest_path
+from benchmark_engines import best_time
+from fmmdistance import distance_from_edge, distance_from_seed_set
+from rasterize import grid_from_bounds, rasterize
+
+COUNTRIES = ["Brazil", "Chile", "Croatia", "Norway", "Italy"]
+SYNTHETIC_SIZES = [128, 256, 512, 1024, 2048, 4096, 8192]
+
+
+def synthetic_shapes():
+    """
+    Make the synthetic shapes, as geometries in a unit square.
+    """
+    x = np.linspace(0.1, 0.9, 200)
+    worm = shapely.LineString(np.column_stack([x, 0.5 + 0.25 * np.sin(3 * np.pi * x)]))
+    return {
+        "ellipse": affinity.scale(shapely.Point(0.5, 0.5).buffer(0.4), 1, 0.5),
+        "worm": worm.buffer(0.06),
+    }
+
+
+def stage_times(image, repeat):
+    """
+    Time every stage on a binary image.
+
+    Returns
+    -------
+    times : dict
+        Shortest run time of every stage, in seconds.
+    """
+    mask = np.asarray(image) > 0
+    times = {}
+
+    medial, times["medial_axis"] = best_time(lambda: medial_axis(mask), repeat)
+    (graph, segments), times["graph"] = best_time(
+        lambda: create_graph_from_skeleton(medial), repeat
+    )
+    (_, path), times["longest_path"] = best_time(
+        lambda: find_longest_path(graph, segments), repeat
+    )
+    backbone_pixels, times["extension"] = best_time(
+        lambda: extend_to_boundary(path, mask), repeat
+    )
+
+    edge, times["distance_from_edge"] = best_time(
+        lambda: distance_from_edge(mask), repeat
+    )
+    seed_sets = {
+        "distance_from_backbone": backbone_pixels,
+        "distance_from_proximal": backbone_pixels[:1],
+        "distance_from_distal": backbone_pixels[-1:],
+    }
+    distances = {}
+    for name, seed_set in seed_sets.items():
+        distances[name], times[name] = best_time(
+            lambda: distance_from_seed_set(mask, seed_set), repeat
+        )
+
+    def parameters():
+        proximal = distances["distance_from_proximal"]
+        distal = distances["distance_from_distal"]
+        from_backbone = distances["distance_from_backbone"]
+        return proximal / (proximal + distal), from_backbone / (from_backbone + edge)
+
+    _, times["parameters"] = best_time(parameters, repeat)
+    return times
+
+
+def benchmark_cases(args):
+    """
+    Generate the (source, name, image) cases to benchmark.
+    """
+    for path in sorted(Path("data").glob("*.png")):
+        yield "data", path.stem, imread(path)[:, :, 0]
+
+    world = gpd.read_file(
+        "data/ne_110m_admin_0_countries/ne_110m_admin_0_countries.shp"
+    )
+    for country in args.countries:
+        geometry = world.loc[world.NAME == country].geometry.iloc[0]
+        grid = grid_from_bounds(geometry.bounds, args.country_size, args.country_size)
+        yield "country", country, rasterize(geometry, grid)
+
+    for name, geometry in synthetic_shapes().items():
+        for size in args.sizes:
+            grid = grid_from_bounds((0, 0, 1, 1), size, size)
+            yield "synthetic", name, rasterize(geometry, grid)
+
+
+def git_commit():
+    """
+    Hash of the checked out commit, or None outside a git repository.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time every stage on the bundled images, some countries and"
+        " synthetic shapes, and append the times to a JSON lines file"
+    )
+    parser.add_argument(
+        "--output", default="benchmark_stages.jsonl", help="JSON lines file"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=SYNTHETIC_SIZES,
+        help="Numbers of rows and columns of the synthetic shapes",
+    )
+    parser.add_argument(
+        "--countries", nargs="*", default=COUNTRIES, help="Countries to include"
+    )
+    parser.add_argument(
+        "--country-size",
+        type=int,
+        default=1024,
+        help="Number of rows and columns of the country rasters",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Number of runs of every stage"
+    )
+    args = parser.parse_args()
+
+    # Every record of this run shares these fields
+    run = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": args.repeat,
+    }
+
+    with open(args.output, "a") as f:
+        for source, name, image in benchmark_cases(args):
+            case = {
+                "source": source,
+                "shape": name,
+                "rows": image.shape[0],
+                "cols": image.shape[1],
+                "pixels": int(np.count_nonzero(image)),
+            }
+            try:
+                times = stage_times(image, args.repeat)
+            except ValueError as exc:
+                f.write(json.dumps({**run, **case, "error": str(exc)}) + "\n")
+                print(f"{source:<9} {name:<12} {image.shape[0]:>5}: failed ({exc})")
+                continue
+
+            for stage, seconds in times.items():
+                record = {**run, **case, "stage": stage, "seconds": seconds}
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+
+            total = sum(times.values())
+            slowest = max(times, key=times.get)
+            print(
+                f"{source:<9} {name:<12} {image.shape[0]:>5}: {total:8.3f} s,"
+                f" slowest {slowest} ({times[slowest]:.3f} s)"
+            )
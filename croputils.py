@@ -0,0 +1,114 @@
+# Crop images to the bounding box of their foreground, and embed results back into full-size arrays
+
+import numpy as np
+
+from pointutils import index_array
+
+# Number of pixels added around the bounding box of the foreground. At least
+# one ring of background pixels is needed for the boundary of the object to
+# lie inside the cropped image.
+CROP_MARGIN = 2
+
+
+def foreground_bounds(image, margin=CROP_MARGIN):
+    """
+    Find the bounding box of the foreground of an image.
+
+    Parameters
+    ----------
+    image : ndarray
+        Binary image.
+    margin : int
+        Number of pixels to add on each side of the bounding box. The box
+        is clipped to the image.
+
+    Returns
+    -------
+    bounds : tuple of slices
+        Row and column slices of the bounding box. If the image has no
+        foreground, the slices cover the whole image.
+    """
+    rows = np.flatnonzero(np.any(image, axis=1))
+    cols = np.flatnonzero(np.any(image, axis=0))
+
+    if len(rows) == 0:
+        return (slice(0, image.shape[0]), slice(0, image.shape[1]))
+
+    return grow_bounds(
+        (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1)),
+        image.shape,
+        margin,
+    )
+
+
+def grow_bounds(bounds, shape, margin=CROP_MARGIN):
+    """
+    Add a margin on each side of a bounding box, clipped to the image.
+
+    Parameters
+    ----------
+    bounds : tuple of slices
+        Row and column slices of the bounding box.
+    shape : tuple
+        Shape of the image.
+    margin : int
+        Number of pixels to add on each side of the bounding box.
+
+    Returns
+    -------
+    bounds : tuple of slices
+        Row and column slices of the grown bounding box.
+    """
+    return tuple(
+        slice(max(int(box.start) - margin, 0), min(int(box.stop) + margin, size))
+        for box, size in zip(bounds, shape)
+    )
+
+
+def shift_points(points, bounds, inverse=False):
+    """
+    Convert (i, j) points between full-image and cropped-image coordinates.
+
+    Parameters
+    ----------
+    points : ndarray or sequence
+        Array of shape (N, 2), or sequence of (i, j) tuples.
+    bounds : tuple of slices
+        Row and column slices of the cropped image.
+    inverse : bool
+        If False, convert from cropped to full-image coordinates. If True,
+        convert from full-image to cropped coordinates.
+
+    Returns
+    -------
+    shifted : ndarray
+        Integer array of shape (N, 2) holding the shifted (i, j) coordinates.
+    """
+    offset = np.array([bounds[0].start, bounds[1].start], dtype=np.intp)
+    if inverse:
+        offset = -offset
+    return index_array(points) + offset
+
+
+def embed(values, shape, bounds):
+    """
+    Embed an array computed on a cropped image into a full-size array.
+
+    Parameters
+    ----------
+    values : ndarray
+        Array computed on the cropped image. May be a masked array.
+    shape : tuple
+        Shape of the full image.
+    bounds : tuple of slices
+        Row and column slices of the cropped image.
+
+    Returns
+    -------
+    full : numpy.ma.MaskedArray
+        Full-size array holding the values inside the bounding box. Pixels
+        outside the bounding box are masked.
+    """
+    full = np.ma.masked_all(shape, dtype=values.dtype)
+    full[bounds] = values
+    return full
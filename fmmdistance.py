@@ -1,8 +1,26 @@
-import skfmm
+from collections import namedtuple
+
 import numpy as np
 
+# skfmm and scipy.ndimage are imported by the engines that use them, so that
+# importing this module stays fast
+
+from croputils import embed, foreground_bounds, grow_bounds, shift_points
+from graphdistance import graph_distance_from_seed_set
+from pointutils import index_array
+from profiling import stage
+
+# The functions of a distance engine. Either may be None if the engine
+# cannot compute that kind of distance.
+DistanceEngine = namedtuple(
+    "DistanceEngine", ["distance_from_edge", "distance_from_seed_set"]
+)
 
-def distance_from_edge(image):
+# Registered distance engines, by name
+DISTANCE_ENGINES = {}
+
+
+def distance_from_edge(image, crop=False, dtype=float, cache=None, engine="fmm"):
     """
     Compute the distance transform of the input image.
 
@@ -10,22 +28,58 @@ def distance_from_edge(image):
     ----------
     image : ndarray
         Binary image.
+    crop : bool, optional
+        If True, only the bounding box of the foreground, with a margin, is
+        processed. Pixels outside the bounding box are masked in the result.
+    dtype : data-type, optional
+        Floating point type of the result, for example numpy.float32 to
+        halve its memory use. The distances are always computed in double
+        precision.
+    cache : ResultCache, optional
+        Cache for the distance transform.
+    engine : str, optional
+        Name of the distance engine, one of the keys of DISTANCE_ENGINES:
+        "fmm" for the fast marching method, or "edt" for the exact Euclidean
+        distance transform, which is faster.
 
     Returns
     -------
     distance : ndarray
         Distance transform of the input image.
     """
-    mask = np.logical_not(image)
-    phi = np.full_like(image, 1, dtype=float)
-    phi[mask] = -1
+    if cache is not None:
+        return cache.get_or_compute(
+            "distance_from_edge",
+            lambda: distance_from_edge(image, crop=crop, dtype=dtype, engine=engine),
+            [np.asarray(image) != 0],
+            {"crop": crop, "dtype": np.dtype(dtype).str, "dx": 1, "engine": engine},
+        )
 
-    distance = skfmm.distance(phi, dx=1)
+    if crop:
+        bounds = foreground_bounds(image)
+        distance = distance_from_edge(image[bounds], dtype=dtype, engine=engine)
+        return embed(distance, image.shape, bounds)
 
-    return distance
+    with stage("distance_from_edge") as counts:
+        distance = _engine_function(engine, "distance_from_edge")(
+            np.asarray(image) != 0
+        )
+        if counts is not None:
+            counts["engine"] = engine
+            counts["grid_pixels"] = int(np.size(image))
+
+    return distance.astype(dtype, copy=False)
 
 
-def distance_from_seed_set(image, seed_set):
+def distance_from_seed_set(
+    image,
+    seed_set,
+    crop=False,
+    dtype=float,
+    cache=None,
+    max_distance=None,
+    engine="fmm",
+):
     """
     Compute the distance transform of the input image from a given set of pixels.
 
@@ -33,29 +87,197 @@ def distance_from_seed_set(image, seed_set):
     ----------
     image : ndarray
         Binary image.
-    seed_set : list of tuples
-        List of (i, j) coordinates of the seed pixels.
+    seed_set : ndarray or sequence
+        Integer array of shape (N, 2) holding the (i, j) coordinates of the
+        seed pixels, or sequence of (i, j) tuples.
+    crop : bool, optional
+        If True, only the bounding box of the foreground, with a margin, is
+        processed. Pixels outside the bounding box are masked in the result,
+        as are all other pixels outside the object.
+    dtype : data-type, optional
+        Floating point type of the result, for example numpy.float32 to
+        halve its memory use. The distances are always computed in double
+        precision.
+    cache : ResultCache, optional
+        Cache for the distance transform.
+    max_distance : float, optional
+        If given, the marching stops at this distance from the seed set, and
+        only the bounding box of the seed set grown by this distance is
+        processed. Pixels that are farther away are masked in the result.
+        Must be positive.
+    engine : str, optional
+        Name of the distance engine, one of the keys of DISTANCE_ENGINES:
+        "fmm" for the fast marching method, or "graph" for shortest paths on
+        the 8-connected pixel grid, which is faster but less accurate, see
+        graphdistance.nearest_seed.
 
     Returns
     -------
     distance : ndarray
         Distance transform of the input image from the given point.
     """
+    seed_set = index_array(seed_set)
+    if max_distance is not None and not max_distance > 0:
+        raise ValueError("max_distance must be positive")
+
+    if cache is not None:
+        return cache.get_or_compute(
+            "distance_from_seed_set",
+            lambda: distance_from_seed_set(
+                image,
+                seed_set,
+                crop=crop,
+                dtype=dtype,
+                max_distance=max_distance,
+                engine=engine,
+            ),
+            [np.asarray(image) > 0, seed_set],
+            {
+                "crop": crop,
+                "dtype": np.dtype(dtype).str,
+                "dx": 1,
+                "max_distance": max_distance,
+                "engine": engine,
+            },
+        )
+
+    if max_distance is not None:
+        # Pixels farther than max_distance from the seed set in a straight
+        # line are also farther along any path inside the object
+        rows, cols = seed_set.T
+        band_bounds = grow_bounds(
+            (slice(rows.min(), rows.max() + 1), slice(cols.min(), cols.max() + 1)),
+            image.shape,
+            margin=int(np.ceil(max_distance)) + 1,
+        )
+        if band_bounds != (slice(0, image.shape[0]), slice(0, image.shape[1])):
+            distance = distance_from_seed_set(
+                image[band_bounds],
+                shift_points(seed_set, band_bounds, inverse=True),
+                crop=crop,
+                dtype=dtype,
+                max_distance=max_distance,
+                engine=engine,
+            )
+            return embed(distance, image.shape, band_bounds)
+
+    if crop:
+        bounds = foreground_bounds(image > 0)
+        height = bounds[0].stop - bounds[0].start
+        width = bounds[1].stop - bounds[1].start
+        cropped_seed_set = shift_points(seed_set, bounds, inverse=True)
+        cropped_seed_set = cropped_seed_set[
+            np.all(
+                (cropped_seed_set >= 0) & (cropped_seed_set < (height, width)), axis=1
+            )
+        ]
+        if len(cropped_seed_set) == 0:
+            raise ValueError(
+                "The seed set must contain at least one pixel inside the object."
+            )
+        distance = distance_from_seed_set(
+            image[bounds],
+            cropped_seed_set,
+            dtype=dtype,
+            max_distance=max_distance,
+            engine=engine,
+        )
+        return embed(distance, image.shape, bounds)
+
     img_bin = image > 0
 
     # Check that at least one pixel in the seed set is inside the object
-    if not np.any(img_bin[tuple(zip(*seed_set))]):
+    if not np.any(img_bin[seed_set[:, 0], seed_set[:, 1]]):
         raise ValueError(
             "The seed set must contain at least one pixel inside the object."
         )
 
+    with stage("distance_from_seed_set") as counts:
+        distance = _engine_function(engine, "distance_from_seed_set")(
+            img_bin, seed_set, max_distance=max_distance
+        )
+        if counts is not None:
+            counts["engine"] = engine
+            counts["grid_pixels"] = int(img_bin.size)
+            counts["seed_pixels"] = len(seed_set)
+
+    return distance.astype(dtype, copy=False)
+
+
+def register_distance_engine(
+    name, distance_from_edge=None, distance_from_seed_set=None
+):
+    """
+    Make a distance engine available to distance_from_edge and
+    distance_from_seed_set.
+
+    Parameters
+    ----------
+    name : str
+        Name of the engine.
+    distance_from_edge : callable, optional
+        Function of a boolean image that returns the signed distance from
+        the edge, positive inside and negative outside the object.
+    distance_from_seed_set : callable, optional
+        Function of a boolean image, an (N, 2) integer array of (i, j) seed
+        pixels with at least one inside the object, and a max_distance
+        keyword argument, that returns the distance inside the object as a
+        masked array.
+    """
+    DISTANCE_ENGINES[name] = DistanceEngine(distance_from_edge, distance_from_seed_set)
+
+
+def _engine_function(engine, field):
+    """
+    Look up the function of a distance engine for a kind of distance.
+    """
+    if engine not in DISTANCE_ENGINES:
+        raise ValueError(f"Unknown distance engine: {engine!r}")
+    function = getattr(DISTANCE_ENGINES[engine], field)
+    if function is None:
+        raise ValueError(
+            f"The {engine!r} distance engine cannot compute the {field.replace('_', ' ')}."
+        )
+    return function
+
+
+def _fmm_distance_from_edge(image):
+    import skfmm
+
+    mask = np.logical_not(image)
+    phi = np.full_like(image, 1, dtype=float)
+    phi[mask] = -1
+
+    return skfmm.distance(phi, dx=1)
+
+
+def _fmm_distance_from_seed_set(image, seed_set, max_distance=None):
+    import skfmm
+
     start = np.full_like(image, 1, dtype=float)
-    for i, j in seed_set:
-        start[i, j] = -1
+    start[seed_set[:, 0], seed_set[:, 1]] = -1
 
-    mask = np.logical_not(img_bin)
+    mask = np.logical_not(image)
     phi = np.ma.masked_array(start, mask)
 
-    distance = skfmm.distance(phi, dx=1)
+    # A narrow band of 0 marches across the whole object
+    return skfmm.distance(phi, dx=1, narrow=0 if max_distance is None else max_distance)
+
+
+def _edt_distance_from_edge(image):
+    from scipy import ndimage
+
+    # The front is halfway between the pixels inside and outside the object,
+    # as in the fast marching method
+    inside = ndimage.distance_transform_edt(image) - 0.5
+    outside = ndimage.distance_transform_edt(np.logical_not(image)) - 0.5
+    return np.where(image, inside, -outside)
+
 
-    return distance
+register_distance_engine(
+    "fmm",
+    distance_from_edge=_fmm_distance_from_edge,
+    distance_from_seed_set=_fmm_distance_from_seed_set,
+)
+register_distance_engine("edt", distance_from_edge=_edt_distance_from_edge)
+register_distance_engine("graph", distance_from_seed_set=graph_distance_from_seed_set)
@@ -0,0 +1,140 @@
+# Compute geodesic distances inside a shape on the 8-connected graph of its pixels
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from pointutils import index_array
+
+# Offsets to the neighbors of a pixel that come after it in row-major order,
+# and the lengths of the steps to them
+_FORWARD_OFFSETS = [(0, 1), (1, -1), (1, 0), (1, 1)]
+_STEP_LENGTHS = [1.0, np.sqrt(2), 1.0, np.sqrt(2)]
+
+
+def pixel_graph(image):
+    """
+    Build the graph of the foreground pixels of a binary image.
+
+    Every foreground pixel is a node, connected to its foreground
+    8-neighbors by edges as long as the step between them.
+
+    Parameters
+    ----------
+    image : ndarray
+        Binary image.
+
+    Returns
+    -------
+    graph : scipy.sparse.csr_matrix
+        Adjacency matrix of the graph, with one edge per pair of neighbors.
+    node_index : ndarray
+        Array of the same shape as the image holding the node of each
+        foreground pixel, and -1 for the background.
+    """
+    mask = np.asarray(image) > 0
+    node_index = np.full(mask.shape, -1, dtype=np.intp)
+    node_index[mask] = np.arange(np.count_nonzero(mask))
+
+    padded = np.pad(node_index, 1, constant_values=-1)
+    height, width = mask.shape
+    rows, cols, weights = [], [], []
+    for (di, dj), length in zip(_FORWARD_OFFSETS, _STEP_LENGTHS):
+        neighbor = padded[1 + di : 1 + di + height, 1 + dj : 1 + dj + width]
+        connected = mask & (neighbor >= 0)
+        rows.append(node_index[connected])
+        cols.append(neighbor[connected])
+        weights.append(np.full(np.count_nonzero(connected), length))
+
+    n_nodes = np.count_nonzero(mask)
+    graph = coo_matrix(
+        (np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(n_nodes, n_nodes),
+    ).tocsr()
+    return graph, node_index
+
+
+def nearest_seed(image, seed_set, max_distance=None):
+    """
+    Compute the geodesic distance from a set of pixels, and the nearest of
+    them, for every pixel inside the object.
+
+    The distance is the length of the shortest 8-connected path inside the
+    object, with diagonal steps of length sqrt(2). It is 0 on the seed
+    pixels, and can overestimate the Euclidean geodesic distance by up to
+    about 8% in directions between the axes and the diagonals.
+
+    Parameters
+    ----------
+    image : ndarray
+        Binary image.
+    seed_set : ndarray or sequence
+        Integer array of shape (N, 2) holding the (i, j) coordinates of the
+        seed pixels, or sequence of (i, j) tuples.
+    max_distance : float, optional
+        If given, the search stops at this distance from the seed set.
+
+    Returns
+    -------
+    distance : numpy.ma.MaskedArray
+        Distance from the seed set. Pixels outside the object, or that
+        cannot be reached, are masked.
+    nearest : numpy.ma.MaskedArray
+        Position in the seed set of the nearest seed pixel, masked where the
+        distance is.
+    """
+    graph, node_index = pixel_graph(image)
+
+    seeds = index_array(seed_set)
+    seed_nodes = node_index[seeds[:, 0], seeds[:, 1]]
+    if not np.any(seed_nodes >= 0):
+        raise ValueError(
+            "The seed set must contain at least one pixel inside the object."
+        )
+
+    # Position of the first seed at each seed node
+    positions = np.flatnonzero(seed_nodes >= 0)
+    nodes, first = np.unique(seed_nodes[positions], return_index=True)
+    seed_position = np.full(graph.shape[0], -1, dtype=np.intp)
+    seed_position[nodes] = positions[first]
+
+    node_distance, _, sources = dijkstra(
+        graph,
+        directed=False,
+        indices=nodes,
+        return_predecessors=True,
+        min_only=True,
+        limit=np.inf if max_distance is None else max_distance,
+    )
+
+    inside = node_index >= 0
+    reached = np.zeros(node_index.shape, dtype=bool)
+    reached[inside] = np.isfinite(node_distance)
+
+    distance = np.zeros(node_index.shape)
+    distance[inside] = np.where(np.isfinite(node_distance), node_distance, 0)
+    # Unreached nodes have a negative source
+    nearest = np.zeros(node_index.shape, dtype=np.intp)
+    nearest[inside] = seed_position[np.maximum(sources, 0)]
+
+    return (
+        np.ma.masked_array(distance, ~reached),
+        np.ma.masked_array(nearest, ~reached),
+    )
+
+
+def graph_distance_from_seed_set(image, seed_set, max_distance=None):
+    """
+    Compute the geodesic distance from a set of pixels on the 8-connected
+    graph of the object, see nearest_seed.
+
+    The distance is shifted by half a pixel, so that, as in the fast
+    marching method, the front is halfway between the seed pixels and their
+    neighbors: the seed pixels are at -0.5 and their 4-neighbors at 0.5.
+    """
+    distance, _ = nearest_seed(
+        image,
+        seed_set,
+        max_distance=None if max_distance is None else max_distance + 0.5,
+    )
+    return distance - 0.5
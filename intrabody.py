@@ -0,0 +1,490 @@
+# Compute the backbone, distance fields and intra-body location parameters of a shape in one call
+
+from collections import namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+from scipy import ndimage
+
+from backbone import (
+    backbone,
+    create_graph_from_skeleton,
+    extend_to_boundary,
+    longest_medial_path,
+)
+from croputils import embed, foreground_bounds, grow_bounds, shift_points
+from fmmdistance import distance_from_edge, distance_from_seed_set
+from pointutils import index_array
+
+IntrabodyFields = namedtuple(
+    "IntrabodyFields",
+    [
+        "backbone",
+        "distance_from_edge",
+        "distance_from_backbone",
+        "distance_from_proximal",
+        "distance_from_distal",
+        "distality",
+        "peripherality",
+    ],
+)
+
+# Fixed point encoding of values in [0, 1], such as the distality and
+# peripherality, as 16-bit integers. The largest code marks missing values.
+FIXED_POINT_SCALE = 65534
+FIXED_POINT_MISSING = 65535
+
+# Smallest image, in pixels, whose fields are computed in a process pool by
+# default. Below it, starting the workers and sending them the mask takes
+# longer than computing the fields, even more so where worker processes are
+# spawned rather than forked, as on Windows.
+PARALLEL_MIN_PIXELS = 2048 * 2048
+
+
+def intrabody_fields(
+    image,
+    max_workers=None,
+    crop=False,
+    dtype=float,
+    cache=None,
+    engines=None,
+    backbone_pixels=None,
+    executor=None,
+):
+    """
+    Compute the backbone, the four distance fields and the intra-body
+    location parameters of the shape in a binary image.
+
+    The distance from the edge does not depend on the backbone, so it is
+    computed while the backbone is being found. The three distance fields
+    that are seeded from the backbone are then computed concurrently. The
+    fast marching solves hold the GIL, so they run in a process pool, for
+    large images or when an executor is given.
+
+    Parameters
+    ----------
+    image : ndarray
+        Binary image. Foreground pixels are represented by 1s. Bckground
+        pixels are represented by 0s. There should be a contiguous region
+        of foreground pixels in the image.
+    max_workers : int, optional
+        Maximum number of worker processes. If 1, everything is computed
+        in the calling process. Defaults to the number of processors for
+        images of at least PARALLEL_MIN_PIXELS pixels, and to 1 for smaller
+        ones.
+    crop : bool, optional
+        If True, only the bounding box of the foreground, with a margin, is
+        processed, and the fields are embedded back into arrays of the size
+        of the image. Pixels outside the bounding box are masked, as are all
+        other pixels outside the shape.
+    dtype : data-type, optional
+        Floating point type of the distance fields, distality and
+        peripherality, for example numpy.float32 to halve their memory use.
+    cache : ResultCache, optional
+        Cache for the backbone and distance fields, which can be shared by
+        the worker processes.
+    engines : dict, optional
+        Distance engine of each distance field, by field name, for example
+        {"distance_from_edge": "edt"}. Fields that are not listed use the
+        fast marching method. See fmmdistance.DISTANCE_ENGINES.
+    backbone_pixels : ndarray, optional
+        Integer array of shape (N, 2) holding the (i, j) coordinates of the
+        backbone pixels, for example from voronoibackbone.backbone_pixels.
+        If given, the distance fields are seeded from it, and the medial
+        axis of the image is not computed.
+    executor : concurrent.futures.Executor, optional
+        Executor to compute the distance fields in, such as a process pool
+        that the caller reuses for many shapes, so that the workers are only
+        started once. If given, max_workers is ignored, and the executor is
+        not shut down.
+
+    Returns
+    -------
+    fields : IntrabodyFields
+        Named tuple holding the backbone, as an (N, 2) array of (i, j)
+        coordinates, the distance from the edge, backbone, proximal and
+        distal points, and the distality and peripherality.
+    """
+    # The foreground mask is computed once and shared by all stages
+    mask = np.asarray(image) > 0
+
+    if crop:
+        bounds = foreground_bounds(mask)
+        fields = intrabody_fields(
+            mask[bounds],
+            max_workers=max_workers,
+            dtype=dtype,
+            cache=cache,
+            engines=engines,
+            backbone_pixels=(
+                None
+                if backbone_pixels is None
+                else shift_points(backbone_pixels, bounds, inverse=True)
+            ),
+            executor=executor,
+        )
+        return IntrabodyFields(
+            shift_points(fields.backbone, bounds),
+            *[embed(field, mask.shape, bounds) for field in fields[1:]],
+        )
+
+    return _compute_fields(
+        mask, max_workers, dtype, cache, engines, backbone_pixels, executor=executor
+    )
+
+
+# The intra-body fields of a shape, stored for its foreground pixels only.
+# indices holds the flat indices of the foreground pixels in an image of the
+# given shape, and every field holds one value per foreground pixel.
+CompactFields = namedtuple(
+    "CompactFields", ["shape", "indices"] + list(IntrabodyFields._fields)
+)
+
+
+def compact_intrabody_fields(
+    image,
+    max_workers=None,
+    dtype=float,
+    cache=None,
+    engines=None,
+    backbone_pixels=None,
+    executor=None,
+):
+    """
+    Compute the backbone, distance fields and intra-body location parameters
+    of a shape, keeping only the values at the foreground pixels.
+
+    Every distance field is reduced to the foreground as soon as it is
+    computed, in the worker process, and the distality and peripherality are
+    computed from the reduced fields. For slender shapes, whose bounding box
+    is mostly background, the fields take a fraction of the memory of full
+    images.
+
+    Parameters
+    ----------
+    image : ndarray
+        Binary image. Foreground pixels are represented by 1s. Bckground
+        pixels are represented by 0s.
+    max_workers, dtype, cache, engines, backbone_pixels, executor
+        See intrabody_fields.
+
+    Returns
+    -------
+    fields : CompactFields
+        Named tuple holding the shape of the image, the flat indices of the
+        foreground pixels, the backbone, and the fields as 1-D masked arrays
+        with one value per foreground pixel. Use to_dense to expand a field
+        to a full image.
+    """
+    mask = np.asarray(image) > 0
+    indices = np.flatnonzero(mask)
+    fields = _compute_fields(
+        mask, max_workers, dtype, cache, engines, backbone_pixels, indices, executor
+    )
+    return CompactFields(mask.shape, indices, *fields)
+
+
+def to_dense(fields, name):
+    """
+    Expand a field of CompactFields to a full image.
+
+    Parameters
+    ----------
+    fields : CompactFields
+        The compact fields.
+    name : str
+        Name of the field, such as "distality".
+
+    Returns
+    -------
+    field : numpy.ma.MaskedArray
+        Array with the shape of the image. Background pixels are masked.
+    """
+    values = getattr(fields, name)
+    size = int(np.prod(fields.shape))
+
+    data = np.zeros(size, dtype=values.dtype)
+    data[fields.indices] = np.ma.getdata(values)
+    mask = np.ones(size, dtype=bool)
+    mask[fields.indices] = np.ma.getmaskarray(values)
+
+    return np.ma.masked_array(data.reshape(fields.shape), mask.reshape(fields.shape))
+
+
+def _compute_fields(
+    mask,
+    max_workers,
+    dtype,
+    cache,
+    engines,
+    backbone_pixels=None,
+    indices=None,
+    executor=None,
+):
+    """
+    Compute the fields of intrabody_fields. If indices are given, every
+    distance field is reduced to the values at these flat indices.
+    """
+    engines = dict.fromkeys(IntrabodyFields._fields[1:5], "fmm") | (engines or {})
+
+    def submit(executor, function, *args, **kwargs):
+        if indices is None:
+            return executor.submit(function, *args, **kwargs)
+        return executor.submit(_values_at, indices, function, *args, **kwargs)
+
+    with _executor(max_workers, mask.size, executor) as executor:
+        edge_future = submit(
+            executor,
+            distance_from_edge,
+            mask,
+            dtype=dtype,
+            cache=cache,
+            engine=engines["distance_from_edge"],
+        )
+
+        if backbone_pixels is None:
+            backbone_pixels = backbone(mask, cache=cache)
+        backbone_pixels = index_array(backbone_pixels)
+        if len(backbone_pixels) == 0:
+            raise ValueError("The backbone must contain at least one pixel")
+        if not _can_march_from(mask, backbone_pixels):
+            raise ValueError(
+                "The backbone must leave a pixel of the object next to it, to "
+                "march the distance from it. The object may be one pixel wide."
+            )
+
+        # The proximal and distal points are the first and last point of the backbone
+        seed_sets = [backbone_pixels, backbone_pixels[:1], backbone_pixels[-1:]]
+        seed_futures = [
+            submit(
+                executor,
+                distance_from_seed_set,
+                mask,
+                seed_set,
+                dtype=dtype,
+                cache=cache,
+                engine=engines[name],
+            )
+            for name, seed_set in zip(IntrabodyFields._fields[2:5], seed_sets)
+        ]
+
+        distance_from_border = edge_future.result()
+        distance_from_backbone, distance_from_proximal, distance_from_distal = [
+            future.result() for future in seed_futures
+        ]
+
+    distality = distance_from_proximal / (distance_from_proximal + distance_from_distal)
+    peripherality = distance_from_backbone / (
+        distance_from_backbone + distance_from_border
+    )
+
+    return IntrabodyFields(
+        backbone_pixels,
+        distance_from_border,
+        distance_from_backbone,
+        distance_from_proximal,
+        distance_from_distal,
+        distality,
+        peripherality,
+    )
+
+
+def _values_at(indices, function, *args, **kwargs):
+    """
+    Compute a field, and return its values at the given flat indices as a
+    1-D masked array.
+    """
+    field = function(*args, **kwargs)
+    return np.ma.masked_array(
+        np.ravel(np.ma.getdata(field))[indices],
+        np.ravel(np.ma.getmaskarray(field))[indices],
+    )
+
+
+ComponentFields = namedtuple(
+    "ComponentFields", ["labels", "backbones"] + list(IntrabodyFields._fields[1:])
+)
+
+
+def intrabody_fields_by_component(
+    image, max_workers=None, dtype=float, cache=None, engines=None, executor=None
+):
+    """
+    Compute the backbone, distance fields and intra-body location parameters
+    of every connected component of the foreground of a binary image.
+
+    Each component is cropped to its own extent and processed independently,
+    in a process pool for large images or when an executor is given. The
+    fields of all components are merged into full-size arrays.
+
+    Parameters
+    ----------
+    image : ndarray
+        Binary image. Foreground pixels are represented by 1s. Bckground
+        pixels are represented by 0s. The foreground may consist of several
+        separate regions, such as the islands of a country.
+    max_workers : int, optional
+        Maximum number of worker processes. If 1, everything is computed
+        in the calling process. Defaults to the number of processors for
+        images of at least PARALLEL_MIN_PIXELS pixels, and to 1 for smaller
+        ones.
+    dtype : data-type, optional
+        Floating point type of the merged fields.
+    cache : ResultCache, optional
+        Cache for the backbones and distance fields of the components.
+    engines : dict, optional
+        Distance engine of each distance field, see intrabody_fields.
+    executor : concurrent.futures.Executor, optional
+        Executor to process the components in, see intrabody_fields.
+
+    Returns
+    -------
+    fields : ComponentFields
+        Named tuple holding the labels of the components, with 0 for the
+        background and 1, 2, ... for the components, the list of backbones
+        of the components as (N, 2) arrays, and the merged distance fields,
+        distality and peripherality. In the merged fields, every pixel holds
+        the value for its own component. Pixels outside the foreground are
+        masked. Components for which no backbone can be found, such as
+        single pixels or lines one pixel wide, get an empty backbone and are
+        masked in the fields.
+    """
+    mask = np.asarray(image) > 0
+    labels, n_components = ndimage.label(mask, structure=np.ones((3, 3)))
+
+    # Bounding box of every component, with a margin of background around it
+    bounds = [grow_bounds(box, mask.shape) for box in ndimage.find_objects(labels)]
+
+    with _executor(max_workers, mask.size, executor) as executor:
+        futures = [
+            executor.submit(
+                _component_fields, labels[box] == label, dtype, cache, engines
+            )
+            for label, box in enumerate(bounds, start=1)
+        ]
+        component_fields = [future.result() for future in futures]
+
+    merged = [
+        np.ma.masked_all(mask.shape, dtype=dtype) for _ in IntrabodyFields._fields[1:]
+    ]
+    backbones = []
+    for label, box, fields in zip(range(1, n_components + 1), bounds, component_fields):
+        if fields is None:
+            backbones.append(np.empty((0, 2), dtype=np.intp))
+            continue
+        backbones.append(shift_points(fields.backbone, box))
+        i, j = np.nonzero(labels[box] == label)
+        for merged_field, field in zip(merged, fields[1:]):
+            merged_field[i + box[0].start, j + box[1].start] = field[i, j]
+
+    return ComponentFields(labels, backbones, *merged)
+
+
+def _component_fields(component_mask, dtype=float, cache=None, engines=None):
+    """
+    Compute the fields of a single component, or None if it has no backbone,
+    that is, if its medial axis has no path between two distinct points, as
+    for a single pixel or a ring, or if none of its pixels off the backbone is
+    a 4-neighbor of the backbone, as for a line one pixel wide, so that the
+    distance from the backbone cannot be marched.
+    """
+    from skimage.morphology import medial_axis
+
+    skeleton = medial_axis(component_mask)
+    graph, _ = create_graph_from_skeleton(skeleton)
+    if all(src == dst for src, dst in graph.edges):
+        return None
+
+    path = longest_medial_path(component_mask, cache=cache, skeleton=skeleton)
+    backbone_pixels = extend_to_boundary(path, component_mask)
+    if not _can_march_from(component_mask, backbone_pixels):
+        return None
+
+    return intrabody_fields(
+        component_mask,
+        max_workers=1,
+        dtype=dtype,
+        cache=cache,
+        engines=engines,
+        backbone_pixels=backbone_pixels,
+    )
+
+
+def _can_march_from(mask, backbone_pixels):
+    """
+    Check that a pixel of the object that is not on the backbone is a
+    4-neighbor of it, so that the fast marching method finds a front.
+    """
+    on_backbone = np.zeros(mask.shape, dtype=bool)
+    on_backbone[backbone_pixels[:, 0], backbone_pixels[:, 1]] = True
+    return np.any(ndimage.binary_dilation(on_backbone) & mask & ~on_backbone)
+
+
+def to_fixed_point(values):
+    """
+    Encode values in [0, 1] as 16-bit fixed point numbers.
+
+    Parameters
+    ----------
+    values : ndarray
+        Values in [0, 1], such as the distality or peripherality. May be a
+        masked array. Masked and NaN values are encoded as missing. Values
+        outside [0, 1], such as the slightly negative peripherality on the
+        backbone itself, are clipped.
+
+    Returns
+    -------
+    codes : ndarray
+        Array of uint16 codes. The resolution is 1 / FIXED_POINT_SCALE.
+    """
+    values = np.ma.masked_invalid(values)
+    codes = np.rint(np.clip(values.filled(0), 0, 1) * FIXED_POINT_SCALE)
+    codes = codes.astype(np.uint16)
+    codes[np.ma.getmaskarray(values)] = FIXED_POINT_MISSING
+    return codes
+
+
+def from_fixed_point(codes, dtype=float):
+    """
+    Decode 16-bit fixed point numbers made by to_fixed_point.
+
+    Returns
+    -------
+    values : numpy.ma.MaskedArray
+        Values in [0, 1]. Missing values are masked.
+    """
+    codes = np.asarray(codes)
+    values = np.true_divide(codes, FIXED_POINT_SCALE, dtype=dtype)
+    return np.ma.masked_array(values, codes == FIXED_POINT_MISSING)
+
+
+def _executor(max_workers, n_pixels, executor=None):
+    """
+    Choose where to run the tasks for an image of n_pixels pixels: in the
+    executor of the caller, which is left running, in a new process pool,
+    or in a stand-in that runs tasks immediately in the calling process.
+    The stand-in is used when only one worker is requested, and by default
+    for images smaller than PARALLEL_MIN_PIXELS.
+    """
+    if executor is not None:
+        return nullcontext(executor)
+    if max_workers == 1 or (max_workers is None and n_pixels < PARALLEL_MIN_PIXELS):
+        return _SerialExecutor()
+    return ProcessPoolExecutor(max_workers=max_workers)
+
+
+class _SerialExecutor:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
@@ -0,0 +1,110 @@
+# Send a job to the server started with job_server.py, and print its result
+
+import argparse
+import json
+import sys
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+# This script only uses the standard library, so that it starts quickly. The
+# scientific libraries are loaded once, in the server.
+
+DEFAULT_URL = "http://127.0.0.1:8765"
+
+
+def submit(job, params=None, url=DEFAULT_URL, timeout=None):
+    """
+    Run a job on the server.
+
+    Parameters
+    ----------
+    job : str
+        Name of the job, such as "country", "image" or "distance", or
+        "health" to list the jobs of the server.
+    params : dict, optional
+        Parameters of the job. Paths should be absolute, because the server
+        may run in another directory.
+    url : str, optional
+        Address of the server.
+    timeout : float, optional
+        Number of seconds to wait for the result.
+
+    Returns
+    -------
+    result : dict
+        Result of the job.
+    """
+    if job == "health":
+        request = urllib.request.Request(f"{url}/health")
+    else:
+        # The server only accepts JSON requests
+        request = urllib.request.Request(
+            f"{url}/{job}",
+            data=json.dumps(params or {}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as exc:
+        raise ValueError(json.loads(exc.read()).get("error", str(exc))) from None
+
+
+def _absolute(path):
+    return None if path is None else str(Path(path).resolve())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send a job to job_server.py")
+    parser.add_argument("--url", default=DEFAULT_URL, help="Address of the server")
+    jobs = parser.add_subparsers(dest="job", required=True)
+
+    country = jobs.add_parser("country", help="Fields of a country, as test_country.py")
+    country.add_argument("name", help="Country name")
+    country.add_argument("--shapefile", default=None, help="Path to the shapefile")
+    country.add_argument("--rows", type=int, default=128, help="Number of rows")
+    country.add_argument("--cols", type=int, default=128, help="Number of columns")
+
+    image = jobs.add_parser("image", help="Fields of a mask image")
+    image.add_argument("path", help="Path to the image")
+
+    distance = jobs.add_parser(
+        "distance", help="Distance from a pixel, as compute_distance.py"
+    )
+    distance.add_argument("path", help="Path to the image")
+    distance.add_argument("i", type=int, help="Row of the pixel")
+    distance.add_argument("j", type=int, help="Column of the pixel")
+
+    for job in (country, image, distance):
+        job.add_argument("--output", default=None, help="Path of an .npz file")
+    for job in (country, image):
+        job.add_argument(
+            "--precision", default="float64", help="Precision of the fields"
+        )
+
+    jobs.add_parser("health", help="List the jobs of the server")
+    jobs.add_parser("shutdown", help="Stop the server")
+    args = parser.parse_args()
+
+    if args.job == "country":
+        params = {"name": args.name, "rows": args.rows, "cols": args.cols}
+        if args.shapefile is not None:
+            params["shapefile"] = _absolute(args.shapefile)
+    elif args.job in ("image", "distance"):
+        params = {"path": _absolute(args.path)}
+        if args.job == "distance":
+            params.update(i=args.i, j=args.j)
+    else:
+        params = {}
+    if getattr(args, "output", None) is not None:
+        params["output"] = _absolute(args.output)
+    if getattr(args, "precision", None) is not None:
+        params["precision"] = args.precision
+
+    try:
+        result = submit(args.job, params, url=args.url)
+    except (ValueError, urllib.error.URLError) as exc:
+        print(f"Job failed: {exc}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,245 @@
+# Keep the libraries and datasets loaded in a local server, and run small jobs sent to it over HTTP
+
+import argparse
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+
+from batch_shapefile import PRECISIONS, image_results
+from fmmdistance import distance_from_seed_set
+from rasterize import grid_from_bounds, rasterize
+from stream_images import read_mask
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+WORLD_SHAPEFILE = (
+    Path(__file__).parent
+    / "data/ne_110m_admin_0_countries/ne_110m_admin_0_countries.shp"
+)
+
+# Registered jobs, by name. A job is a function of the parameters of a
+# request, as keyword arguments, that returns a JSON serializable dict.
+JOBS = {}
+
+
+def register_job(name, function):
+    """
+    Make a job available to the clients of the server.
+    """
+    JOBS[name] = function
+
+
+@lru_cache(maxsize=8)
+def read_layer(shapefile):
+    """
+    Read a shapefile once, and keep it for the following jobs.
+    """
+    import geopandas as gpd
+
+    return gpd.read_file(shapefile)
+
+
+def country_job(
+    name,
+    shapefile=WORLD_SHAPEFILE,
+    name_field="NAME",
+    rows=128,
+    cols=128,
+    supersample=1,
+    precision="float64",
+    output=None,
+):
+    """
+    Compute the fields of a feature of a shapefile, as test_country.py does,
+    and write them to the output .npz file, if given.
+    """
+    layer = read_layer(str(Path(shapefile).resolve()))
+    matches = layer.loc[layer[name_field] == name]
+    if matches.empty:
+        raise ValueError(f"No feature with {name_field} {name!r} in {shapefile}")
+    geometry = matches.unary_union
+
+    grid = grid_from_bounds(geometry.bounds, rows, cols)
+    image = rasterize(geometry, grid, supersample=supersample)
+    arrays, summary = image_results(image, precision=_check_precision(precision))
+    arrays["bounds"] = np.array(geometry.bounds)
+    return _finish(arrays, {"name": name, **summary}, output)
+
+
+def image_job(path, precision="float64", output=None):
+    """
+    Compute the fields of a mask image, and write them to the output .npz
+    file, if given.
+    """
+    arrays, summary = image_results(
+        read_mask(path), precision=_check_precision(precision)
+    )
+    return _finish(arrays, {"image": str(path), **summary}, output)
+
+
+def distance_job(path, i, j, output=None):
+    """
+    Compute the distance from pixel (i, j) inside a mask image, as
+    compute_distance.py does, and write it to the output .npz file, if
+    given.
+    """
+    mask = read_mask(path)
+    distance = distance_from_seed_set(mask, [(int(i), int(j))])
+    summary = {
+        "image": str(path),
+        "seed": [int(i), int(j)],
+        "max_distance": float(np.ma.max(distance)),
+    }
+    return _finish({"distance": np.ma.filled(distance, np.nan)}, summary, output)
+
+
+def _check_precision(precision):
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision!r}")
+    return precision
+
+
+def _finish(arrays, summary, output):
+    """
+    Write the arrays of a job to its output file, if any, and return its
+    summary.
+    """
+    if output is not None:
+        np.savez_compressed(output, **arrays)
+        summary["output"] = str(output)
+    return summary
+
+
+register_job("country", country_job)
+register_job("image", image_job)
+register_job("distance", distance_job)
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    """
+    Run the job named by the path of a POST request, such as /country, with
+    the JSON object in the body as parameters, and answer with its result.
+    Requests must have the application/json content type. Jobs run one at a
+    time. GET /health lists the jobs.
+    """
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/health":
+            self._reply(404, {"error": f"Unknown path: {self.path}"})
+            return
+        self._reply(200, {"pid": os.getpid(), "jobs": sorted(JOBS)})
+
+    def do_POST(self):
+        name = self.path.strip("/")
+        # Browsers only send JSON to another origin after a preflight request,
+        # which the server does not answer, so web pages cannot post jobs
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.split(";")[0].strip().lower() != "application/json":
+            self._reply(415, {"error": "The request must be application/json"})
+            return
+
+        if name == "shutdown":
+            self._reply(200, {"stopping": True})
+            threading.Thread(target=self.server.shutdown).start()
+            return
+        if name not in JOBS:
+            self._reply(404, {"error": f"Unknown job: {name!r}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            params = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as exc:
+            self._reply(400, {"error": f"Invalid request: {exc}"})
+            return
+
+        start_time = time.perf_counter()
+        try:
+            with self.server.job_lock:
+                result = JOBS[name](**params)
+        except (TypeError, ValueError, OSError) as exc:
+            self._reply(400, {"error": str(exc)})
+            return
+        except Exception as exc:
+            self._reply(500, {"error": f"{type(exc).__name__}: {exc}"})
+            return
+
+        result["seconds"] = time.perf_counter() - start_time
+        self._reply(200, result)
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def warm_up(shapefiles=()):
+    """
+    Import the libraries that the jobs use, and read the given shapefiles,
+    so that the first job is as fast as the following ones.
+    """
+    import geopandas  # noqa: F401
+    import networkx  # noqa: F401
+    import skfmm  # noqa: F401
+    from scipy import ndimage  # noqa: F401
+    from skimage.morphology import medial_axis
+
+    for shapefile in shapefiles:
+        read_layer(str(Path(shapefile).resolve()))
+
+    # A tiny job runs the first-call setup of the libraries
+    image = np.zeros((16, 16), dtype=bool)
+    image[4:12, 2:14] = True
+    medial_axis(image)
+    distance_from_seed_set(image, [(8, 8)])
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, shapefiles=(), verbose=False):
+    """
+    Run the job server until it is sent a shutdown request or interrupted.
+    """
+    warm_up(shapefiles)
+    server = ThreadingHTTPServer((host, port), JobHandler)
+    server.job_lock = threading.Lock()
+    server.verbose = verbose
+    print(f"Serving jobs {sorted(JOBS)} on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run a local server that keeps the libraries and shapefiles"
+        " loaded, and runs the jobs sent by job_client.py"
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Address to listen on")
+    parser.add_argument(
+        "--port", type=int, default=DEFAULT_PORT, help="Port to listen on"
+    )
+    parser.add_argument(
+        "--preload",
+        nargs="*",
+        default=[WORLD_SHAPEFILE],
+        help="Shapefiles to read at startup",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.preload, args.verbose)
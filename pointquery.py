@@ -0,0 +1,185 @@
+# Sample computed fields at arbitrary points, in world or pixel coordinates, in bounded chunks
+
+import numpy as np
+
+from profiling import stage
+from rasterize import world_to_pixel
+
+# Number of points handled at once
+QUERY_CHUNK_SIZE = 2**20
+
+INTERPOLATION_METHODS = ("nearest", "bilinear")
+
+
+def sample_fields(
+    fields,
+    points,
+    grid=None,
+    method="bilinear",
+    fill_value=np.nan,
+    chunk_size=QUERY_CHUNK_SIZE,
+):
+    """
+    Sample fields, such as the distality and peripherality, at many points.
+
+    The points are processed in chunks, and all points of a chunk are
+    interpolated at once, so memory use is bounded by the chunk size and not
+    by the number of points. The pixel positions and weights of a chunk are
+    shared by all fields.
+
+    A point is outside the shape, and gets the fill value, if the pixel
+    whose center is nearest to it lies outside the grid or has no value,
+    that is, if it is masked or NaN. With bilinear interpolation, the four
+    surrounding pixels are weighted by their distance to the point, and
+    pixels without a value are left out of the average.
+
+    Parameters
+    ----------
+    fields : dict
+        Fields by name, as 2-D arrays on the same grid. May be masked arrays
+        or memory-mapped arrays. For example,
+        {"distality": fields.distality, "peripherality": fields.peripherality}
+        with the fields returned by intrabody.intrabody_fields.
+    points : array_like
+        Array of shape (N, 2) holding the (x, y) world coordinates of the
+        points if a grid is given, or else their fractional (i, j) pixel
+        coordinates.
+    grid : RasterGrid, optional
+        Grid of pixel centers of the fields, such as the grid the shape was
+        rasterized on.
+    method : str, optional
+        Interpolation method, "nearest" or "bilinear".
+    fill_value : float, optional
+        Value of the points outside the shape.
+    chunk_size : int, optional
+        Number of points handled at once.
+
+    Returns
+    -------
+    samples : dict
+        1-D float arrays with one value per point, by field name.
+    """
+    if method not in INTERPOLATION_METHODS:
+        raise ValueError(f"Unknown interpolation method: {method!r}")
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    shapes = {np.shape(field) for field in fields.values()}
+    if len(shapes) > 1 or any(len(shape) != 2 for shape in shapes):
+        raise ValueError("The fields must be 2-D arrays of the same shape")
+
+    samples = {name: np.empty(len(points)) for name in fields}
+    if not fields:
+        return samples
+    shape = shapes.pop()
+
+    with stage("sample_fields") as counts:
+        for start in range(0, len(points), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            if grid is None:
+                rows, cols = points[chunk].T
+            else:
+                rows, cols = world_to_pixel(points[chunk, 0], points[chunk, 1], grid)
+            neighbors = _neighbors(rows, cols, shape, method)
+            for name, field in fields.items():
+                samples[name][chunk] = _interpolate(field, neighbors, fill_value)
+
+        if counts is not None:
+            counts["points"] = len(points)
+            counts["fields"] = len(fields)
+
+    return samples
+
+
+def sample_field(field, points, grid=None, method="bilinear", fill_value=np.nan):
+    """
+    Sample a single field at many points, see sample_fields.
+
+    Returns
+    -------
+    samples : ndarray
+        1-D float array with one value per point.
+    """
+    return sample_fields(
+        {"field": field}, points, grid=grid, method=method, fill_value=fill_value
+    )["field"]
+
+
+def _neighbors(rows, cols, shape, method):
+    """
+    Find the pixels that the value at each point is interpolated from.
+
+    Returns
+    -------
+    on_grid : ndarray
+        Boolean array that is True for the points whose nearest pixel is on
+        the grid. The other arrays only cover these points.
+    nearest : tuple
+        Row and column indices of the nearest pixel of each point.
+    corners : list
+        (rows, cols, weights) of the pixels to interpolate from. For the
+        nearest method, this is the nearest pixel with a weight of 1. For
+        the bilinear method, these are the four pixels around each point,
+        clamped to the grid.
+    """
+    nrows, ncols = shape
+
+    # The nearest pixel decides whether a point is inside the shape
+    nearest_row = np.floor(rows + 0.5)
+    nearest_col = np.floor(cols + 0.5)
+    on_grid = (
+        (nearest_row >= 0)
+        & (nearest_row < nrows)
+        & (nearest_col >= 0)
+        & (nearest_col < ncols)
+    )
+    nearest = (
+        nearest_row[on_grid].astype(np.intp),
+        nearest_col[on_grid].astype(np.intp),
+    )
+    if method == "nearest":
+        return on_grid, nearest, [(*nearest, np.ones(len(nearest[0])))]
+
+    # Fractional position of each point between the four pixels around it
+    rows, cols = rows[on_grid], cols[on_grid]
+    row0 = np.clip(np.floor(rows), 0, nrows - 1).astype(np.intp)
+    col0 = np.clip(np.floor(cols), 0, ncols - 1).astype(np.intp)
+    row1 = np.minimum(row0 + 1, nrows - 1)
+    col1 = np.minimum(col0 + 1, ncols - 1)
+    t = np.clip(rows - row0, 0, 1)
+    u = np.clip(cols - col0, 0, 1)
+    corners = [
+        (row0, col0, (1 - t) * (1 - u)),
+        (row0, col1, (1 - t) * u),
+        (row1, col0, t * (1 - u)),
+        (row1, col1, t * u),
+    ]
+    return on_grid, nearest, corners
+
+
+def _interpolate(field, neighbors, fill_value):
+    """
+    Interpolate a field from the pixels found by _neighbors. Pixels without
+    a value are left out, and points whose nearest pixel has no value get
+    the fill value.
+    """
+    on_grid, nearest, corners = neighbors
+    data = np.ma.getdata(field)
+    mask = np.ma.getmask(field)
+
+    def gather(i, j):
+        values = np.asarray(data[i, j], dtype=float)
+        if mask is not np.ma.nomask:
+            values[mask[i, j]] = np.nan
+        return values
+
+    inside = np.isfinite(gather(*nearest))
+    total = np.zeros(len(inside))
+    weights = np.zeros(len(inside))
+    for i, j, weight in corners:
+        values = gather(i, j)
+        valid = np.isfinite(values)
+        total[valid] += weight[valid] * values[valid]
+        weights[valid] += weight[valid]
+
+    result = np.full(len(on_grid), fill_value, dtype=float)
+    result[np.flatnonzero(on_grid)[inside]] = total[inside] / weights[inside]
+    return result
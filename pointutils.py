@@ -1,7 +1,11 @@
 # Implement the IndexPointCollection class here
 
+import numpy as np
+
 
 class IndexPoint:
+    __slots__ = ("_row_index", "_col_index")
+
     def __init__(self, indices):
         self._row_index = indices[0]
         self._col_index = indices[1]
@@ -9,6 +13,17 @@ class IndexPoint:
     def __repr__(self) -> str:
         return f"({self._row_index}, {self._col_index})"
 
+    def __eq__(self, other_point):
+        if not isinstance(other_point, IndexPoint):
+            return NotImplemented
+        return (
+            self._row_index == other_point._row_index
+            and self._col_index == other_point._col_index
+        )
+
+    def __hash__(self):
+        return hash((self._row_index, self._col_index))
+
     def is_near(self, other_point):
         return (
             abs(self._row_index - other_point._row_index) <= 1
@@ -25,12 +40,96 @@ class IndexPoint:
             raise ValueError("Unknown metric")
 
 
+def index_array(points):
+    """
+    Convert points to an array of pixel indices.
+
+    Parameters
+    ----------
+    points : ndarray or sequence
+        Array of shape (N, 2), or sequence of (i, j) tuples or IndexPoints.
+
+    Returns
+    -------
+    indices : ndarray
+        Integer array of shape (N, 2) holding the (i, j) indices of the
+        points. Arrays of the right type are returned without copying.
+    """
+    if isinstance(points, np.ndarray):
+        return points.astype(np.intp, copy=False).reshape(-1, 2)
+    points = list(points)
+    if points and isinstance(points[0], IndexPoint):
+        points = [(p._row_index, p._col_index) for p in points]
+    return np.array(points, dtype=np.intp).reshape(-1, 2)
+
+
 class IndexPointCollection:
     def __init__(self, row_indices, col_indices):
-        self.points = [IndexPoint((i, j)) for i, j in zip(row_indices, col_indices)]
+        self.rows = np.asarray(row_indices, dtype=np.intp).ravel()
+        self.cols = np.asarray(col_indices, dtype=np.intp).ravel()
+        self.points = [
+            IndexPoint((i, j)) for i, j in zip(self.rows.tolist(), self.cols.tolist())
+        ]
+
+        # Occupancy grid holding the position of each point in self.points,
+        # or -1 where there is no point. The grid has a one-pixel border so
+        # that the 3x3 neighborhood of any point can be sliced directly.
+        if len(self.points) > 0:
+            self._row_offset = int(self.rows.min()) - 1
+            self._col_offset = int(self.cols.min()) - 1
+            shape = (
+                int(self.rows.max()) - self._row_offset + 2,
+                int(self.cols.max()) - self._col_offset + 2,
+            )
+        else:
+            self._row_offset, self._col_offset = 0, 0
+            shape = (0, 0)
+        self._occupancy = np.full(shape, -1, dtype=np.intp)
+        self._occupancy[self.rows - self._row_offset, self.cols - self._col_offset] = (
+            np.arange(len(self.points))
+        )
+
+    def __len__(self):
+        return len(self.points)
+
+    def __contains__(self, point):
+        return self.point_at(point._row_index, point._col_index) is not None
+
+    def point_at(self, i, j):
+        """
+        Look up the point at the given indices.
+
+        Returns None if there is no point at (i, j).
+        """
+        i, j = i - self._row_offset, j - self._col_offset
+        if not (
+            0 <= i < self._occupancy.shape[0] and 0 <= j < self._occupancy.shape[1]
+        ):
+            return None
+        position = self._occupancy[i, j]
+        return self.points[position] if position >= 0 else None
 
     def neighbors(self, point):
-        return [p for p in self.points if p.distance_to(point) > 0 and p.is_near(point)]
+        # The 3x3 block around the point, in row-major order
+        i = point._row_index - self._row_offset
+        j = point._col_index - self._col_offset
+        if not (
+            1 <= i < self._occupancy.shape[0] - 1
+            and 1 <= j < self._occupancy.shape[1] - 1
+        ):
+            return [
+                p
+                for p in (
+                    self.point_at(point._row_index + di, point._col_index + dj)
+                    for di in range(-1, 2)
+                    for dj in range(-1, 2)
+                    if (di, dj) != (0, 0)
+                )
+                if p is not None
+            ]
+        block = self._occupancy[i - 1 : i + 2, j - 1 : j + 2].ravel().tolist()
+        del block[4]
+        return [self.points[position] for position in block if position >= 0]
 
     def other_neighbors(self, point, previous_point):
         all_neighbors = self.neighbors(point)
@@ -38,13 +137,14 @@ class IndexPointCollection:
 
     def foward_neighbors(self, point, previous_point):
         all_neighbors = self.neighbors(point)
+        previous_neighbors = set(self.neighbors(previous_point))
         return [
             p
             for p in all_neighbors
-            if p != previous_point and p not in self.neighbors(previous_point)
+            if p != previous_point and p not in previous_neighbors
         ]
 
-    def walk_to_node(self, current_point, previous_point):
+    def walk_to_node(self, current_point, previous_point, nodes=None):
         """
         Coming from previous_point, walk in the direction of current_point until
         a dead end or a junction is reached.
@@ -55,6 +155,9 @@ class IndexPointCollection:
             The point reached by taking one step from previous_point in the given direction.
         previous_point : IndexPoint
             The point from which the current_point was reached.
+        nodes : container of IndexPoint, optional
+            Known nodes. The walk also stops when it reaches one of these,
+            which guarantees that walks along closed loops terminate.
 
         Returns
         -------
@@ -63,7 +166,8 @@ class IndexPointCollection:
         entry_point : IndexPoint
             The point from which the node_point was reached.
         node_type : str
-            The type of node encountered: 'end' or 'junction'.
+            The type of node encountered: 'end', 'junction' or 'node' for a
+            known node.
         distance_walked : int
             The number of steps taken from previous_point to node_point.
         segment: list
@@ -82,24 +186,29 @@ class IndexPointCollection:
         node_encountered = False
 
         while node_encountered == False:
-            # Move to the next point
-            previous_point, current_point = current_point, forward_neighbors[0]
-
-            # Update the segment
-            segment.append(current_point)
-
-            # Update the distance walked
-            distance_walked += previous_point.distance_to(current_point)
-
-            forward_neighbors = self.foward_neighbors(current_point, previous_point)
-
             # Check if we have reached a node
-            if len(forward_neighbors) == 0:
+            if nodes is not None and current_point in nodes:
+                node_encountered = True
+                node_type = "node"
+            elif len(forward_neighbors) == 0:
                 node_encountered = True
                 node_type = "end"
             elif len(forward_neighbors) > 1:
                 node_encountered = True
                 node_type = "junction"
+            elif len(segment) > len(self.points):
+                raise RuntimeError("Walk did not reach a node")
+            else:
+                # Move to the next point
+                previous_point, current_point = current_point, forward_neighbors[0]
+
+                # Update the segment
+                segment.append(current_point)
+
+                # Update the distance walked
+                distance_walked += previous_point.distance_to(current_point)
+
+                forward_neighbors = self.foward_neighbors(current_point, previous_point)
 
         # Determine the node point and entry point
         node_point = current_point
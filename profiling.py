@@ -0,0 +1,108 @@
+# Report the run time, peak memory and sizes of the stages of a computation to listeners
+
+import json
+import logging
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+
+# One stage of a computation. peak_bytes is None if memory is not traced.
+StageRecord = namedtuple("StageRecord", ["stage", "seconds", "peak_bytes", "counts"])
+
+# Functions called with a StageRecord at the end of every stage
+_listeners = []
+
+# Stages that are running, innermost last, with the traced memory at their
+# start and the highest traced memory seen so far
+_running = []
+
+
+@contextmanager
+def stage(name):
+    """
+    Mark a stage of a computation.
+
+    If nobody is listening, this does nothing and yields None. Otherwise it
+    yields a dict, where the stage can store counts such as the number of
+    pixels it processed, and reports a StageRecord to the listeners when the
+    stage ends. Counts should only be computed when the dict is given, so
+    that they cost nothing when nobody is listening.
+    """
+    if not _listeners:
+        yield None
+        return
+
+    counts = {}
+    frame = None
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        if _running and _running[-1] is not None:
+            # The peak is about to be reset, so save it for the outer stage
+            _running[-1][1] = max(_running[-1][1], peak)
+        tracemalloc.reset_peak()
+        frame = [current, current]
+    _running.append(frame)
+
+    start_time = time.perf_counter()
+    try:
+        yield counts
+    finally:
+        seconds = time.perf_counter() - start_time
+        _running.pop()
+        peak_bytes = None
+        if frame is not None and tracemalloc.is_tracing():
+            peak = max(frame[1], tracemalloc.get_traced_memory()[1])
+            peak_bytes = peak - frame[0]
+            if _running and _running[-1] is not None:
+                _running[-1][1] = max(_running[-1][1], peak)
+
+        record = StageRecord(name, seconds, peak_bytes, counts)
+        for listener in list(_listeners):
+            listener(record)
+
+
+@contextmanager
+def profiling(listener=None, memory=False):
+    """
+    Collect the stages of the computations run inside the block.
+
+    Only stages that run in this process are seen, so use a single worker
+    when profiling intrabody_fields or the batch script.
+
+    Parameters
+    ----------
+    listener : callable, optional
+        Function called with a StageRecord at the end of every stage, for
+        example log_stage. By default the records are collected in a list.
+    memory : bool, optional
+        If True, the peak memory allocated by every stage is traced with
+        tracemalloc, which slows the computation down.
+
+    Yields
+    ------
+    records : list
+        List of the StageRecords of the stages that ended so far, in the
+        order they ended. Empty if a listener is given.
+    """
+    records = []
+    if listener is None:
+        listener = records.append
+
+    started_tracing = memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    _listeners.append(listener)
+    try:
+        yield records
+    finally:
+        _listeners.remove(listener)
+        if started_tracing:
+            tracemalloc.stop()
+
+
+def log_stage(record, logger=logging.getLogger("intrabody.profiling")):
+    """
+    Log a StageRecord as a JSON object, at the INFO level.
+    """
+    logger.info(json.dumps(record._asdict()))
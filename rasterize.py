@@ -0,0 +1,187 @@
+# Make binary images of polygons directly from their rings with a vectorized scanline fill
+
+from collections import namedtuple
+
+import numpy as np
+import shapely
+
+# A regular grid of pixel centers. Row 0 is at miny and column 0 is at minx.
+# The outermost pixel centers lie on the bounds.
+RasterGrid = namedtuple(
+    "RasterGrid", ["minx", "miny", "maxx", "maxy", "nrows", "ncols"]
+)
+
+# Maximum number of row-edge pairs handled at once by the scanline fill
+_CHUNK_SIZE = 2**22
+
+
+def grid_from_bounds(bounds, nrows=128, ncols=128):
+    """
+    Make a grid of pixel centers spanning the given bounds.
+
+    Parameters
+    ----------
+    bounds : sequence
+        The (minx, miny, maxx, maxy) bounds of the grid.
+    nrows, ncols : int
+        Number of rows and columns in the grid.
+
+    Returns
+    -------
+    grid : RasterGrid
+        The grid.
+    """
+    minx, miny, maxx, maxy = (float(value) for value in bounds)
+    return RasterGrid(minx, miny, maxx, maxy, int(nrows), int(ncols))
+
+
+def pixel_centers(grid):
+    """
+    Compute the coordinates of the pixel centers of a grid.
+
+    Returns
+    -------
+    x : ndarray
+        The x coordinates of the columns.
+    y : ndarray
+        The y coordinates of the rows.
+    """
+    return (
+        np.linspace(grid.minx, grid.maxx, grid.ncols),
+        np.linspace(grid.miny, grid.maxy, grid.nrows),
+    )
+
+
+def world_to_pixel(x, y, grid):
+    """
+    Convert world coordinates to fractional pixel coordinates of a grid.
+
+    Pixel (i, j) has its center at row coordinate i and column coordinate
+    j. If the grid has a single row or column, or no extent along an axis,
+    all points map to 0 along that axis.
+
+    Parameters
+    ----------
+    x, y : array_like
+        World coordinates of the points.
+    grid : RasterGrid
+        Grid of pixel centers.
+
+    Returns
+    -------
+    rows : ndarray
+        Fractional row coordinates of the points.
+    cols : ndarray
+        Fractional column coordinates of the points.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    rows = np.zeros_like(y)
+    cols = np.zeros_like(x)
+    if grid.nrows > 1 and grid.maxy > grid.miny:
+        rows = (y - grid.miny) * ((grid.nrows - 1) / (grid.maxy - grid.miny))
+    if grid.ncols > 1 and grid.maxx > grid.minx:
+        cols = (x - grid.minx) * ((grid.ncols - 1) / (grid.maxx - grid.minx))
+    return rows, cols
+
+
+def rasterize(geometry, grid, supersample=1):
+    """
+    Make a binary image of a polygon or multipolygon.
+
+    The image is filled row by row from the crossings between the rows and
+    the edges of the polygon rings, using the even-odd rule. All rows and
+    edges are handled with whole-array operations, a bounded number of
+    row-edge pairs at a time.
+
+    Parameters
+    ----------
+    geometry : shapely.Geometry
+        Polygon or multipolygon. The parts of a multipolygon should not
+        overlap.
+    grid : RasterGrid
+        Grid of pixel centers.
+    supersample : int, optional
+        If greater than 1, each pixel is sampled at supersample x supersample
+        points, and is set if at least half of them are inside.
+
+    Returns
+    -------
+    is_inside : ndarray
+        Binary image. Pixels inside the geometry are True, outside are False.
+    """
+    x, y = pixel_centers(grid)
+    dx = x[1] - x[0] if grid.ncols > 1 else 0.0
+    dy = y[1] - y[0] if grid.nrows > 1 else 0.0
+
+    if supersample > 1:
+        # Sub-pixel sample points, evenly spread over the area of each pixel
+        offsets = (np.arange(supersample) + 0.5) / supersample - 0.5
+        x = (x[:, np.newaxis] + offsets * dx).ravel()
+        y = (y[:, np.newaxis] + offsets * dy).ravel()
+        samples = _scanline_fill(
+            _ring_edges(geometry), x[0], dx / supersample, len(x), y
+        )
+        coverage = samples.reshape(
+            grid.nrows, supersample, grid.ncols, supersample
+        ).mean(axis=(1, 3))
+        return coverage >= 0.5
+
+    return _scanline_fill(_ring_edges(geometry), x[0], dx, len(x), y)
+
+
+def _ring_edges(geometry):
+    """
+    Collect the edges of all rings of a geometry.
+
+    Returns
+    -------
+    edges : ndarray
+        Array of shape (N, 4) holding the x0, y0, x1, y1 coordinates of the
+        edges.
+    """
+    rings = shapely.get_rings(shapely.get_parts(geometry))
+    coordinates, ring_index = shapely.get_coordinates(rings, return_index=True)
+
+    # Consecutive coordinates in the same ring form an edge
+    same_ring = ring_index[1:] == ring_index[:-1]
+    return np.hstack([coordinates[:-1][same_ring], coordinates[1:][same_ring]])
+
+
+def _scanline_fill(edges, x0, dx, ncols, y):
+    """
+    Fill the inside of a set of rings, one row per y value.
+
+    Column j has the x coordinate x0 + j * dx. A pixel is inside if an odd
+    number of edges cross its row to the left of it.
+    """
+    image = np.zeros((len(y), ncols), dtype=bool)
+    if len(edges) == 0 or ncols == 0:
+        return image
+
+    ex0, ey0, ex1, ey1 = edges.T
+    chunk_rows = max(1, _CHUNK_SIZE // len(edges))
+
+    for start in range(0, len(y), chunk_rows):
+        rows = y[start : start + chunk_rows, np.newaxis]
+
+        # Half-open rule, so that a row through a vertex is crossed once
+        crosses = (ey0 <= rows) != (ey1 <= rows)
+        row_index, edge_index = np.nonzero(crosses)
+        t = (rows[row_index, 0] - ey0[edge_index]) / (ey1[edge_index] - ey0[edge_index])
+        x_cross = ex0[edge_index] + t * (ex1[edge_index] - ex0[edge_index])
+
+        # Toggle the inside state at the first column right of each crossing
+        if dx > 0:
+            toggle_col = np.ceil((x_cross - x0) / dx)
+        else:
+            toggle_col = np.where(x_cross <= x0, 0, ncols)
+        toggle_col = np.clip(toggle_col, 0, ncols).astype(np.intp)
+
+        toggles = np.zeros((len(rows), ncols + 1), dtype=np.intp)
+        np.add.at(toggles, (row_index, toggle_col), 1)
+        image[start : start + len(rows)] = (
+            np.cumsum(toggles, axis=1)[:, :ncols] % 2 == 1
+        )
+
+    return image
@@ -0,0 +1,147 @@
+# Cache intermediate results on disk, keyed by a hash of their inputs and parameters
+
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+# Default size budget of the cache, in bytes
+CACHE_SIZE = 2**30
+
+# Part of every key. Change it when the cached computations change, so that
+# old entries are no longer used.
+CACHE_VERSION = 1
+
+
+class ResultCache:
+    """
+    Content-addressed cache of arrays in a directory.
+
+    Every entry is an uncompressed .npz file named after the SHA-256 hash of
+    the name of the computation, its input arrays and its parameters. The
+    least recently used entries are removed when the files take more than
+    the size budget.
+
+    Several processes can share a cache directory. Entries are written to a
+    temporary file and renamed into place, so a reader sees either a whole
+    entry or none. An entry that is removed by another process while it is
+    being looked up is treated as missing.
+
+    Parameters
+    ----------
+    directory : str or Path
+        Directory holding the cache. It is created if needed.
+    max_bytes : int, optional
+        Size budget of the cache, in bytes.
+    """
+
+    def __init__(self, directory, max_bytes=CACHE_SIZE):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def get_or_compute(self, name, compute, inputs, params=None):
+        """
+        Look up a result, or compute and store it.
+
+        Parameters
+        ----------
+        name : str
+            Name of the computation.
+        compute : callable
+            Function without arguments that computes the result, an ndarray
+            or a masked array.
+        inputs : list of ndarray
+            Arrays the result depends on.
+        params : dict, optional
+            Other parameters the result depends on. The values must have a
+            repr that identifies them.
+
+        Returns
+        -------
+        result : ndarray
+            The cached or computed result.
+        """
+        key = self.key(name, inputs, params)
+        result = self.load(key)
+        if result is None:
+            result = compute()
+            self.store(key, result)
+        return result
+
+    def key(self, name, inputs, params=None):
+        """
+        Compute the key of a result from its name, inputs and parameters.
+        """
+        digest = hashlib.sha256(f"{CACHE_VERSION}:{name}".encode())
+        for array in inputs:
+            array = np.ascontiguousarray(array)
+            # The shape is hashed before packing, which flattens the array
+            digest.update(f"{array.dtype.str}{array.shape}".encode())
+            if array.dtype == bool:
+                array = np.packbits(array)
+            digest.update(array.tobytes())
+        for param, value in sorted((params or {}).items()):
+            digest.update(f"{param}={value!r}".encode())
+        return digest.hexdigest()
+
+    def load(self, key):
+        """
+        Read the result stored under a key, or None if there is none.
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as entry:
+                data = entry["data"]
+                if "mask" in entry:
+                    mask = np.unpackbits(entry["mask"], count=data.size)
+                    data = np.ma.masked_array(data, mask.reshape(data.shape) > 0)
+            # Mark the entry as recently used
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            return None
+        return data
+
+    def store(self, key, result):
+        """
+        Store a result under a key, then shrink the cache to its budget.
+        """
+        arrays = {"data": np.ma.getdata(result)}
+        if np.ma.isMaskedArray(result):
+            arrays["mask"] = np.packbits(np.ma.getmaskarray(result))
+
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        temporary_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(temporary_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(temporary_path, path)
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in its
+        size budget.
+        """
+        entries = []
+        for path in self.directory.glob("*/*.npz"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}.npz"
@@ -0,0 +1,164 @@
+# Analyse a shape lazily, computing each intermediate result once and only when it is needed
+
+from functools import cached_property
+
+import numpy as np
+
+from backbone import (
+    coarse_to_fine_longest_path,
+    create_graph_from_skeleton,
+    extend_to_boundary,
+    find_longest_path,
+    longest_medial_path,
+)
+from fmmdistance import distance_from_edge, distance_from_seed_set
+from intrabody import IntrabodyFields
+
+
+class ShapeAnalysis:
+    """
+    Backbone, distance fields and intra-body location parameters of the
+    shape in a binary image, computed on first access.
+
+    Every quantity is computed from the ones it depends on, which are
+    computed once and shared. For example, reading the distality computes
+    the medial axis, the skeleton graph, the backbone and the distances from
+    the proximal and distal points, but not the distance from the edge.
+
+    Parameters
+    ----------
+    image : ndarray
+        Binary image. Foreground pixels are represented by 1s. Bckground
+        pixels are represented by 0s. There should be a contiguous region
+        of foreground pixels in the image.
+    levels : int, optional
+        Number of levels in the image pyramid used to find the backbone, see
+        backbone.backbone.
+    dtype : data-type, optional
+        Floating point type of the distance fields and parameters.
+    cache : ResultCache, optional
+        Cache for the longest medial path and the distance fields. If given,
+        the longest path is looked up in the cache instead of being found on
+        the skeleton graph.
+    engines : dict, optional
+        Distance engine of each distance field, by field name, see
+        intrabody_fields.
+    """
+
+    def __init__(self, image, levels=1, dtype=float, cache=None, engines=None):
+        self.mask = np.asarray(image) > 0
+        self.levels = levels
+        self.dtype = dtype
+        self.cache = cache
+        self.engines = engines or {}
+
+    @cached_property
+    def _medial_axis_and_distance(self):
+        from skimage.morphology import medial_axis
+
+        return medial_axis(self.mask, return_distance=True)
+
+    @property
+    def medial_axis(self):
+        """Binary image of the medial axis."""
+        return self._medial_axis_and_distance[0]
+
+    @property
+    def medial_distance(self):
+        """Euclidean distance from each foreground pixel to the background."""
+        return self._medial_axis_and_distance[1]
+
+    @cached_property
+    def skeleton_graph(self):
+        """Graph of the medial axis and its segments."""
+        return create_graph_from_skeleton(self.medial_axis)
+
+    @cached_property
+    def longest_path(self):
+        """(N, 2) array of the pixels in the longest path along the medial axis."""
+        if self.levels > 1:
+            return coarse_to_fine_longest_path(self.mask, self.levels, cache=self.cache)
+        if self.cache is not None:
+            # The medial axis is only computed if the path is not cached, and
+            # then shared with the medial_axis property
+            return longest_medial_path(
+                self.mask, cache=self.cache, skeleton=lambda: self.medial_axis
+            )
+        _, longest_path_points = find_longest_path(*self.skeleton_graph)
+        return longest_path_points
+
+    @cached_property
+    def backbone(self):
+        """(N, 2) array of the (i, j) pixels in the backbone."""
+        return extend_to_boundary(self.longest_path, self.mask)
+
+    @property
+    def proximal_point(self):
+        """First (i, j) point of the backbone."""
+        return self.backbone[0]
+
+    @property
+    def distal_point(self):
+        """Last (i, j) point of the backbone."""
+        return self.backbone[-1]
+
+    @cached_property
+    def distance_from_edge(self):
+        """Distance from the edge of the shape."""
+        return distance_from_edge(
+            self.mask,
+            dtype=self.dtype,
+            cache=self.cache,
+            engine=self.engines.get("distance_from_edge", "fmm"),
+        )
+
+    @cached_property
+    def distance_from_backbone(self):
+        """Distance from the backbone, inside the shape."""
+        return self._distance_from(self.backbone, "distance_from_backbone")
+
+    @cached_property
+    def distance_from_proximal(self):
+        """Distance from the proximal point, inside the shape."""
+        return self._distance_from(self.backbone[:1], "distance_from_proximal")
+
+    @cached_property
+    def distance_from_distal(self):
+        """Distance from the distal point, inside the shape."""
+        return self._distance_from(self.backbone[-1:], "distance_from_distal")
+
+    @cached_property
+    def distality(self):
+        """Distality, dP / (dP + dD)."""
+        return self.distance_from_proximal / (
+            self.distance_from_proximal + self.distance_from_distal
+        )
+
+    @cached_property
+    def peripherality(self):
+        """Peripherality, dB / (dB + dE)."""
+        return self.distance_from_backbone / (
+            self.distance_from_backbone + self.distance_from_edge
+        )
+
+    @property
+    def fields(self):
+        """All fields, as returned by intrabody_fields."""
+        return IntrabodyFields(
+            self.backbone,
+            self.distance_from_edge,
+            self.distance_from_backbone,
+            self.distance_from_proximal,
+            self.distance_from_distal,
+            self.distality,
+            self.peripherality,
+        )
+
+    def _distance_from(self, seed_set, name):
+        return distance_from_seed_set(
+            self.mask,
+            seed_set,
+            dtype=self.dtype,
+            cache=self.cache,
+            engine=self.engines.get(name, "fmm"),
+        )
@@ -0,0 +1,310 @@
+# Compute the intra-body location parameters of every mask image in a directory as a stream, with bounded memory
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from skimage.io import imread
+
+from batch_shapefile import PRECISIONS, image_results, write_results
+from resultcache import CACHE_SIZE, ResultCache
+
+IMAGE_SUFFIXES = (".png", ".tif", ".tiff")
+
+
+def image_paths(source):
+    """
+    Find the mask images to process.
+
+    Parameters
+    ----------
+    source : str or Path
+        Directory, whose images and those of its subdirectories are produced
+        as they are found, or glob pattern, whose matches are. Only files
+        with one of the IMAGE_SUFFIXES are used.
+
+    Yields
+    ------
+    path : Path
+        Path of an image.
+    """
+    if Path(source).is_dir():
+        paths = _walk_files(source)
+    else:
+        paths = (Path(path) for path in glob.iglob(str(source), recursive=True))
+    for path in paths:
+        if path.suffix.lower() in IMAGE_SUFFIXES and path.is_file():
+            yield path
+
+
+def _walk_files(directory):
+    """
+    Produce the files in a directory tree as they are read from the disk,
+    without listing any directory first.
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_files(entry.path)
+            else:
+                yield Path(entry.path)
+
+
+def source_root(source):
+    """
+    Find the directory that the images of a directory or glob pattern are
+    named relative to: the directory itself, or the part of the pattern
+    before its first wildcard.
+    """
+    source = Path(source)
+    if source.is_dir():
+        return source
+    root = Path()
+    for part in source.parts[:-1]:
+        if any(wildcard in part for wildcard in "*?["):
+            break
+        root /= part
+    return root
+
+
+def output_name(path, root):
+    """
+    Name the results of an image after its path relative to the source root,
+    such as "a/x.png" for masks/a/x.png, so that images with the same name
+    in different directories, or with different suffixes, do not overwrite
+    each other.
+    """
+    return Path(path).relative_to(root).as_posix()
+
+
+def pending_paths(paths, output_dir, root):
+    """
+    Skip the images whose summary is already in the output directory.
+    """
+    for path in paths:
+        if not (Path(output_dir) / f"{output_name(path, root)}.json").exists():
+            yield path
+
+
+def read_mask(path):
+    """
+    Read a mask image. Pixels with a nonzero first channel are foreground.
+    """
+    image = imread(path)
+    if image.ndim == 3:
+        image = image[:, :, 0]
+    return image > 0
+
+
+def process_image(path, output_dir, root, precision="float64", cache=None):
+    """
+    Read one mask image, compute its fields and write them to <name>.npz
+    and <name>.json in the output directory, where <name> is the
+    output_name of the image relative to the source root, see
+    batch_shapefile.image_results.
+
+    Returns
+    -------
+    summary : dict
+        Summary statistics of the image.
+    """
+    start_time = time.perf_counter()
+
+    arrays, summary = image_results(read_mask(path), precision=precision, cache=cache)
+    summary = {
+        "image": str(path),
+        **summary,
+        "seconds": time.perf_counter() - start_time,
+    }
+    write_results(output_dir, output_name(path, root), arrays, summary)
+
+    return summary
+
+
+def bounded_map(executor, function, items, max_in_flight, *args):
+    """
+    Apply a function to a stream of items in an executor, holding at most
+    max_in_flight items at a time.
+
+    The next item is only drawn from the stream once the oldest result has
+    been consumed, so a slow consumer holds back the producer, and the
+    memory used does not grow with the number of items.
+
+    Yields
+    ------
+    item : object
+        The input item.
+    future : concurrent.futures.Future
+        Future of function(item, *args). Futures are produced in the order
+        of the items.
+    """
+    pending = deque()
+    for item in items:
+        pending.append((item, executor.submit(function, item, *args)))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+
+def stream_images(
+    source,
+    output_dir,
+    max_workers=None,
+    max_in_flight=None,
+    precision="float64",
+    cache=None,
+):
+    """
+    Process the mask images in a directory or glob pattern one by one, as
+    a stream.
+
+    The images are found lazily, the ones that are already done are
+    skipped, and each remaining image is read, processed and written by a
+    worker process. Only the summaries come back to the calling process.
+
+    Parameters
+    ----------
+    source : str or Path
+        Directory or glob pattern of the images, see image_paths.
+    output_dir : str or Path
+        Directory to write the results to.
+    max_workers : int, optional
+        Number of worker processes. Defaults to the number of processors.
+    max_in_flight : int, optional
+        Largest number of images being processed or waiting to be consumed.
+        Defaults to twice the number of workers.
+    precision : str, optional
+        Storage precision, one of the keys of PRECISIONS.
+    cache : ResultCache, optional
+        Cache for the backbones and distance fields.
+
+    Yields
+    ------
+    path : Path
+        Path of the image.
+    summary : dict or None
+        Summary statistics of the image, or None if it failed.
+    error : Exception or None
+        The error raised while processing the image, if any.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    root = source_root(source)
+
+    if max_in_flight is None:
+        max_in_flight = 2 * (max_workers or os.cpu_count() or 1)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for path, future in bounded_map(
+            executor,
+            process_image,
+            pending_paths(image_paths(source), output_dir, root),
+            max_in_flight,
+            output_dir,
+            root,
+            precision,
+            cache,
+        ):
+            try:
+                yield path, future.result(), None
+            except Exception as exc:
+                yield path, None, exc
+
+
+def main(
+    source,
+    output_dir,
+    max_workers=None,
+    max_in_flight=None,
+    precision="float64",
+    cache_dir=None,
+    cache_size=CACHE_SIZE,
+):
+    cache = ResultCache(cache_dir, cache_size) if cache_dir is not None else None
+    output_dir = Path(output_dir)
+
+    start_time = time.perf_counter()
+    processed, failed = 0, []
+
+    # Summaries are appended as they arrive, so an interrupted run keeps them
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with open(output_dir / "summary.jsonl", "a") as f:
+        for path, summary, error in stream_images(
+            source,
+            output_dir,
+            max_workers=max_workers,
+            max_in_flight=max_in_flight,
+            precision=precision,
+            cache=cache,
+        ):
+            if error is not None:
+                failed.append(path)
+                print(f"{path}: failed ({error})")
+                continue
+            processed += 1
+            f.write(json.dumps(summary) + "\n")
+            f.flush()
+            print(f"[{processed}] {path}: {summary['seconds']:.2f} s")
+
+    elapsed = time.perf_counter() - start_time
+    print(
+        f"Processed {processed} images in {elapsed:.1f} s "
+        f"({processed / elapsed if elapsed > 0 else 0:.2f} images/s), {len(failed)} failed"
+    )
+
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compute intra-body location parameters for every mask image in a"
+        " directory or glob pattern, as a stream. Images that are already done in"
+        " the output directory are skipped."
+    )
+    parser.add_argument("source", help="Directory or glob pattern of PNG/TIFF masks")
+    parser.add_argument("output_dir", help="Directory to write the results to")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of worker processes"
+    )
+    parser.add_argument(
+        "--in-flight",
+        type=int,
+        default=None,
+        help="Largest number of images held at once (default: twice the workers)",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=sorted(PRECISIONS),
+        default="float64",
+        help="Precision of the stored fields, see batch_shapefile.py",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Directory of a cache for the backbones and distance fields",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=CACHE_SIZE // 2**20,
+        help="Size budget of the cache in MiB",
+    )
+    args = parser.parse_args()
+
+    failed = main(
+        args.source,
+        args.output_dir,
+        max_workers=args.workers,
+        max_in_flight=args.in_flight,
+        precision=args.precision,
+        cache_dir=args.cache_dir,
+        cache_size=args.cache_size * 2**20,
+    )
+    sys.exit(1 if failed else 0)
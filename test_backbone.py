@@ -107,8 +107,7 @@ axs[6].set_title("Longest path points")
 axs[6].plot(j_medial, i_medial, "ro")
 
 # Plot the longest path on the original image
-i_path = [point._row_index for point in longest_path_points]
-j_path = [point._col_index for point in longest_path_points]
+i_path, j_path = longest_path_points.T
 axs[6].plot(j_path, i_path, color="cyan")
 
 # Plot the first and last points in the path in a different color
@@ -123,8 +122,7 @@ fig, ax = plt.subplots(figsize=(8, 8))
 ax.imshow(img, cmap="gray")
 
 # Plot the longest path on the original image
-i_path = [i for (i, j) in full_backbone]
-j_path = [j for (i, j) in full_backbone]
+i_path, j_path = full_backbone.T
 ax.plot(j_path, i_path, color="green")
 
 # Plot the first and last points in the path in a different color
@@ -1,11 +1,10 @@
 import geopandas as gpd
 from pathlib import Path
 import matplotlib.pyplot as plt
-import numpy as np
 import sys
 
-from backbone import backbone
-from fmmdistance import distance_from_edge, distance_from_seed_set
+from intrabody import intrabody_fields
+from rasterize import grid_from_bounds, rasterize
 
 
 def main(country_name):
@@ -19,50 +18,25 @@ def main(country_name):
     # Make a binary image of the country
     # Pixels inside the country are 1, outside are 0
     nrows, ncols = 128, 128
-    xv, yv = np.meshgrid(
-        np.linspace(country.bounds.minx, country.bounds.maxx, ncols),
-        np.linspace(country.bounds.miny, country.bounds.maxy, nrows),
-    )
-
-    # Convert the coordinates to a 1D array
-    xv = xv.flatten()
-    yv = yv.flatten()
-
-    # Create a GeoDataFrame with the coordinates
-    gdf = gpd.GeoDataFrame(geometry=gpd.points_from_xy(xv, yv))
-
-    # Use the within method to check if the points are inside the country
-    gdf["is_inside"] = gdf.within(country.unary_union)
-
-    # Reshape the array to a 2D array
-    is_inside = gdf["is_inside"].values.reshape(nrows, ncols)
+    grid = grid_from_bounds(country.total_bounds, nrows, ncols)
+    is_inside = rasterize(country.unary_union, grid)
 
     # Plot the binary image
     plt.imshow(is_inside, origin="lower", cmap="gray")
 
-    # Find the backbone
-    backbone_pixels = backbone(is_inside)
-    i_backbone = [i for i, j in backbone_pixels]
-    j_backbone = [j for i, j in backbone_pixels]
+    # Find the backbone and compute the distance fields from the edge,
+    # the backbone, and the proximal and distal points. These are the
+    # first and last point of the backbone.
+    fields = intrabody_fields(is_inside)
+    i_backbone, j_backbone = fields.backbone.T
 
     # Plot the backbone
     plt.plot(j_backbone, i_backbone, "r-")
 
-    # Compute the distance transform from the edge
-    distance_from_border = distance_from_edge(is_inside)
-
-    # Compute the distance transform from the backbone pixels
-    seed_set = list(zip(i_backbone, j_backbone))
-    distance_from_backbone = distance_from_seed_set(is_inside, seed_set)
-
-    # Identify the proximal and distal points
-    # These are the first and last point of the backbone
-    proximal_point = seed_set[0]
-    distal_point = seed_set[-1]
-
-    # Compute the distance from the proximal and distal points
-    distance_from_proximal = distance_from_seed_set(is_inside, [proximal_point])
-    distance_from_distal = distance_from_seed_set(is_inside, [distal_point])
+    distance_from_border = fields.distance_from_edge
+    distance_from_backbone = fields.distance_from_backbone
+    distance_from_proximal = fields.distance_from_proximal
+    distance_from_distal = fields.distance_from_distal
 
     # Plot the results
     fig, axs = plt.subplots(2, 2, figsize=(15, 5))
@@ -87,11 +61,8 @@ def main(country_name):
     axs[1, 1].axis("off")
     axs[1, 1].set_title("Distance transform from distal point")
 
-    # Compute distality and peripherality values
-    distality = distance_from_proximal / (distance_from_proximal + distance_from_distal)
-    peripherality = distance_from_backbone / (
-        distance_from_backbone + distance_from_border
-    )
+    distality = fields.distality
+    peripherality = fields.peripherality
 
     # Plot the distality and peripherality values
     fig, axs = plt.subplots(1, 2, figsize=(15, 5))
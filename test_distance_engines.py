@@ -0,0 +1,48 @@
+import numpy as np
+from skimage.io import imread
+
+from backbone import backbone
+from fmmdistance import distance_from_seed_set
+
+FIXTURES = ["01_blob", "04_crescent", "05_bend"]
+
+
+def test_graph_engine_aligned_with_fmm():
+    # Near the seeds, where the graph distance has not yet drifted from the
+    # Euclidean one, both engines put the front halfway between the seed
+    # pixels and their neighbors
+    for name in FIXTURES:
+        image = imread(f"data/{name}.png")[:, :, 0] > 0
+        pixels = backbone(image)
+        for seed_set in (pixels, pixels[:1]):
+            fmm = distance_from_seed_set(image, seed_set)
+            graph = distance_from_seed_set(image, seed_set, engine="graph")
+            near = ~np.ma.getmaskarray(fmm) & (fmm < 5)
+            assert abs(np.mean((graph - fmm)[near])) < 0.2, name
+            assert np.all(graph[seed_set[:, 0], seed_set[:, 1]] == -0.5)
+
+
+def test_graph_engine_offsets():
+    image = np.ones((9, 9), dtype=bool)
+    graph = distance_from_seed_set(image, [(4, 4)], engine="graph")
+    fmm = distance_from_seed_set(image, [(4, 4)])
+    for i, j in [(3, 4), (5, 4), (4, 3), (4, 5)]:
+        assert graph[i, j] == 0.5
+        assert abs(fmm[i, j] - 0.5) < 0.1
+    assert graph[4, 4] == -0.5 and -0.5 <= fmm[4, 4] < 0
+
+
+def test_graph_engine_max_distance():
+    # The same pixels are reached as by the fast marching method
+    image = np.ones((21, 21), dtype=bool)
+    graph = distance_from_seed_set(image, [(10, 10)], max_distance=4, engine="graph")
+    assert graph.max() <= 4
+    assert not np.ma.getmaskarray(graph)[10, 14]
+    assert np.ma.getmaskarray(graph)[10, 15]
+
+
+if __name__ == "__main__":
+    test_graph_engine_aligned_with_fmm()
+    test_graph_engine_offsets()
+    test_graph_engine_max_distance()
+    print("OK")
@@ -0,0 +1,34 @@
+import numpy as np
+
+from backbone import extend_to_boundary
+from fmmdistance import distance_from_seed_set
+
+
+def test_corner_pinch():
+    # A bar with a pixel that touches it only by a corner, in line with the
+    # path, so that the extension would otherwise step onto it
+    image = np.zeros((7, 12), dtype=bool)
+    image[2:5, 1:9] = True
+    image[5, 9] = True
+    path = [(3, j) for j in range(2, 8)] + [(4, 8)]
+    extended = extend_to_boundary(path, image)
+    assert (5, 9) not in map(tuple, extended)
+    for end in (extended[0], extended[-1]):
+        distance_from_seed_set(image, [end])
+
+
+def test_corner_pinch_at_path_end():
+    # The path itself ends on the pinched pixel
+    image = np.zeros((7, 12), dtype=bool)
+    image[2:5, 1:9] = True
+    image[5, 9] = True
+    path = [(3, j) for j in range(2, 9)] + [(4, 8), (5, 9)]
+    extended = extend_to_boundary(path, image)
+    assert tuple(extended[-1]) != (5, 9)
+    distance_from_seed_set(image, [extended[-1]])
+
+
+if __name__ == "__main__":
+    test_corner_pinch()
+    test_corner_pinch_at_path_end()
+    print("OK")
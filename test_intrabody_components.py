@@ -0,0 +1,43 @@
+import numpy as np
+from skimage.draw import disk
+
+from intrabody import intrabody_fields_by_component
+
+
+def test_components_without_backbone():
+    # A blob, a single pixel, a line one pixel wide and an L of three pixels
+    # joined by a corner: only the blob gets a backbone
+    image = np.zeros((40, 60), dtype=bool)
+    image[disk((15, 15), 10)] = True
+    image[35, 5] = True
+    image[35, 20:30] = True
+    image[34, 40] = image[35, 38:40] = True
+    fields = intrabody_fields_by_component(image, max_workers=1)
+    assert [len(backbone) > 0 for backbone in fields.backbones] == [
+        True,
+        False,
+        False,
+        False,
+    ]
+    assert not np.any(fields.distality.mask[fields.labels == 1])
+    assert np.all(fields.distality.mask[fields.labels > 1])
+
+
+def test_errors_propagate():
+    # An error that has nothing to do with the shape of a component is raised
+    image = np.zeros((40, 40), dtype=bool)
+    image[disk((20, 20), 10)] = True
+    try:
+        intrabody_fields_by_component(
+            image, max_workers=1, engines={"distance_from_edge": "unknown"}
+        )
+    except ValueError as exc:
+        assert "unknown" in str(exc)
+    else:
+        raise AssertionError("no error for an unknown distance engine")
+
+
+if __name__ == "__main__":
+    test_components_without_backbone()
+    test_errors_propagate()
+    print("OK")
@@ -0,0 +1,54 @@
+import numpy as np
+from skimage.io import imread
+
+from backbone import backbone
+from intrabody import (
+    FIXED_POINT_SCALE,
+    compact_intrabody_fields,
+    from_fixed_point,
+    intrabody_fields,
+    to_dense,
+    to_fixed_point,
+)
+
+
+def test_fixed_point_round_trip():
+    values = np.ma.masked_array(
+        [0.0, 1.0, 0.5, 1 / 3, -0.01, 1.2, np.nan, 0.25],
+        [False] * 7 + [True],
+    )
+    codes = to_fixed_point(values)
+    assert codes.dtype == np.uint16
+    decoded = from_fixed_point(codes)
+
+    # NaN and masked values are missing, and the rest are within half a step
+    assert list(np.ma.getmaskarray(decoded)) == [False] * 6 + [True, True]
+    expected = np.clip(values.filled(0)[:6], 0, 1)
+    assert np.abs(decoded[:6] - expected).max() <= 0.5 / FIXED_POINT_SCALE
+    assert decoded[0] == 0 and decoded[1] == 1
+
+    # Decoding to single precision
+    assert from_fixed_point(codes, dtype=np.float32).dtype == np.float32
+
+
+def test_compact_round_trip():
+    # The same backbone for both, as the medial axis breaks ties at random
+    image = imread("data/04_crescent.png")[:, :, 0] > 0
+    pixels = backbone(image)
+    dense = intrabody_fields(image, max_workers=1, backbone_pixels=pixels)
+    compact = compact_intrabody_fields(image, max_workers=1, backbone_pixels=pixels)
+
+    assert compact.shape == image.shape
+    assert np.array_equal(compact.indices, np.flatnonzero(image))
+    assert np.array_equal(compact.backbone, dense.backbone)
+    for name in compact._fields[3:]:
+        field = to_dense(compact, name)
+        expected = np.ma.masked_array(dense._asdict()[name], ~image)
+        assert np.array_equal(np.ma.getmaskarray(field), np.ma.getmaskarray(expected))
+        assert np.allclose(field.compressed(), expected.compressed()), name
+
+
+if __name__ == "__main__":
+    test_fixed_point_round_trip()
+    test_compact_round_trip()
+    print("OK")
@@ -0,0 +1,82 @@
+import numpy as np
+from networkx import shortest_path
+from networkx.algorithms.shortest_paths.weighted import (
+    all_pairs_bellman_ford_path_length,
+)
+from scipy import ndimage
+from scipy.spatial import cKDTree
+from skimage.io import imread
+from skimage.morphology import medial_axis
+
+from backbone import (
+    coarse_to_fine_longest_path,
+    create_graph_from_connected_points,
+    create_graph_from_skeleton,
+    extract_foreground_ij,
+    find_longest_path,
+    longest_medial_path,
+)
+
+FIXTURES = ["01_blob", "02_blob", "03_convex", "04_crescent", "05_bend"]
+
+
+def all_pairs_longest_path(graph, segments):
+    # The all-pairs search that find_longest_path replaced
+    distances = dict(all_pairs_bellman_ford_path_length(graph, weight="weight"))
+    longest_distance = 0
+    longest_path_src_dst = []
+    for src, dstlist in distances.items():
+        for dst, distance in dstlist.items():
+            if distance > longest_distance:
+                longest_distance = distance
+                longest_path_src_dst = [src, dst]
+
+    nodes = list(shortest_path(graph, *longest_path_src_dst))
+    points = [
+        segments[a][b] if b in segments.get(a, {}) else segments[b][a][::-1]
+        for a, b in zip(nodes[:-1], nodes[1:])
+    ]
+    return nodes, np.concatenate(points)
+
+
+def test_same_path_as_all_pairs_search():
+    # The same nodes and points, in the same order, so that the proximal and
+    # distal ends do not swap
+    for name in FIXTURES:
+        image = imread(f"data/{name}.png")[:, :, 0]
+        for seed in range(5):
+            skeleton = medial_axis(image, rng=seed)
+            for graph, segments in [
+                create_graph_from_skeleton(skeleton),
+                create_graph_from_connected_points(*extract_foreground_ij(skeleton)),
+            ]:
+                nodes, points = find_longest_path(graph, segments)
+                expected_nodes, expected_points = all_pairs_longest_path(
+                    graph, segments
+                )
+                assert nodes == expected_nodes, (name, seed)
+                assert np.array_equal(points, expected_points), (name, seed)
+
+
+def test_coarse_to_fine_close_to_full_resolution():
+    # Shapes whose medial axis has no branches that the coarse levels lose,
+    # upsampled so that the pyramid has three levels
+    for name in ["03_convex", "04_crescent"]:
+        image = imread(f"data/{name}.png")[:, :, 0] > 0
+        image = ndimage.zoom(image.astype(float), 4, order=1) > 0.5
+        full = longest_medial_path(image, skeleton=medial_axis(image, rng=0))
+        pyramid = coarse_to_fine_longest_path(image, 3)
+
+        deviation = max(
+            cKDTree(full).query(pyramid)[0].max(), cKDTree(pyramid).query(full)[0].max()
+        )
+        assert deviation <= 3, name
+        ends = np.array([full[0], full[-1]])
+        for end in (pyramid[0], pyramid[-1]):
+            assert np.hypot(*(ends - end).T).min() <= 3, name
+
+
+if __name__ == "__main__":
+    test_same_path_as_all_pairs_search()
+    test_coarse_to_fine_close_to_full_resolution()
+    print("OK")
@@ -0,0 +1,71 @@
+import numpy as np
+
+from pointquery import sample_field, sample_fields
+from rasterize import grid_from_bounds, pixel_centers
+
+
+def linear_field(shape):
+    i, j = np.indices(shape)
+    return 2.0 * i + 3.0 * j + 1
+
+
+def test_bilinear_reproduces_linear_field():
+    field = linear_field((5, 6))
+    rng = np.random.default_rng(0)
+    points = rng.uniform([0, 0], [4, 5], size=(100, 2))
+    samples = sample_field(field, points)
+    assert np.allclose(samples, 2 * points[:, 0] + 3 * points[:, 1] + 1)
+
+    # At the pixel centers, both methods give the pixel values
+    centers = np.argwhere(np.ones(field.shape, dtype=bool)).astype(float)
+    for method in ("nearest", "bilinear"):
+        assert np.allclose(sample_field(field, centers, method=method), field.ravel())
+
+    # The nearest method takes the value of the nearest pixel
+    assert sample_field(field, [(1.4, 2.6)], method="nearest")[0] == field[1, 3]
+
+
+def test_missing_values():
+    field = np.ma.masked_array(np.ones((4, 4)), np.zeros((4, 4), dtype=bool))
+    field[1, 1] = np.ma.masked
+    field.data[1, 1] = 100
+    field[2, 2] = np.nan
+    samples = sample_field(
+        field, [(0.4, 0.4), (1.2, 1.2), (1.6, 1.6), (-0.6, 0), (0, 3.6)]
+    )
+
+    # Pixels without a value are left out of the average, and points whose
+    # nearest pixel has none, or is off the grid, get the fill value
+    assert samples[0] == 1
+    assert np.isnan(samples[1]) and np.isnan(samples[2])
+    assert np.isnan(samples[3]) and np.isnan(samples[4])
+    assert sample_field(field, [(1.2, 1.2)], fill_value=-1)[0] == -1
+
+
+def test_world_coordinates_and_chunks():
+    grid = grid_from_bounds((10, 20, 15, 24), 5, 6)
+    field = linear_field((5, 6))
+    x, y = pixel_centers(grid)
+    rows = np.array([1, 3, 4])
+    cols = np.array([0.25, 2.5, 4.75])
+    points = np.column_stack([np.interp(cols, np.arange(len(x)), x), y[rows]])
+    samples = sample_fields({"a": field, "b": -field}, points, grid=grid, chunk_size=2)
+    assert np.allclose(samples["a"], 2 * rows + 3 * cols + 1)
+    assert np.allclose(samples["b"], -samples["a"])
+
+
+def test_unknown_method():
+    try:
+        sample_field(np.ones((2, 2)), [(0, 0)], method="cubic")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("An unknown method must raise a ValueError")
+
+
+if __name__ == "__main__":
+    test_bilinear_reproduces_linear_field()
+    test_missing_values()
+    test_world_coordinates_and_chunks()
+    test_unknown_method()
+    print("OK")
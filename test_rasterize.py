@@ -0,0 +1,50 @@
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from rasterize import grid_from_bounds, pixel_centers, rasterize
+
+WORLD_FILE = "./data/ne_110m_admin_0_countries/ne_110m_admin_0_countries.shp"
+
+
+def assert_matches_shapely(geometry, grid):
+    image = rasterize(geometry, grid)
+    x, y = pixel_centers(grid)
+    x, y = np.meshgrid(x, y)
+    expected = shapely.contains_xy(geometry, x, y)
+
+    # The scanline fill and shapely only disagree on pixel centers that lie
+    # on the boundary, where shapely counts them as outside
+    differs = image != expected
+    on_boundary = shapely.distance(
+        geometry.boundary, shapely.points(x[differs], y[differs])
+    )
+    step = max(x[0, 1] - x[0, 0], y[1, 0] - y[0, 0])
+    assert np.all(on_boundary < 1e-9 * step)
+
+
+def test_countries():
+    world = gpd.read_file(WORLD_FILE).set_index("NAME")
+    for name in ["Egypt", "Antarctica", "Chile", "Indonesia", "Croatia"]:
+        geometry = world.loc[name].geometry
+        grid = grid_from_bounds(geometry.bounds, 256, 256)
+        assert_matches_shapely(geometry, grid)
+
+
+def test_hole_and_vertices_on_rows():
+    # Pixels of size 1, so that vertices and horizontal edges lie on the
+    # pixel centers
+    grid = grid_from_bounds((0, 0, 20, 20), 21, 21)
+    polygon = shapely.Polygon(
+        [(2, 2), (18, 2), (18, 10), (10, 18), (2, 10)],
+        holes=[[(6, 6), (12, 6), (12, 12), (6, 12)]],
+    )
+    assert_matches_shapely(polygon, grid)
+    image = rasterize(polygon, grid)
+    assert image[4, 4] and not image[9, 9] and not image[19, 19]
+
+
+if __name__ == "__main__":
+    test_countries()
+    test_hole_and_vertices_on_rows()
+    print("OK")
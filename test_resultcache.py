@@ -0,0 +1,63 @@
+import os
+import tempfile
+
+import numpy as np
+
+from fmmdistance import distance_from_edge
+from resultcache import ResultCache
+
+
+def test_mask_shape_in_key():
+    # Masks with the same bits but different shapes must not share an entry
+    mask = np.zeros((8, 16), dtype=bool)
+    mask[2:6, 2:14] = True
+    reshaped = mask.reshape(16, 8)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ResultCache(cache_dir)
+        assert cache.key("edge", [mask]) != cache.key("edge", [reshaped])
+
+        distance_from_edge(mask, cache=cache)
+        assert distance_from_edge(reshaped, cache=cache).shape == (16, 8)
+
+
+def test_least_recently_used_evicted():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ResultCache(cache_dir)
+        arrays = {name: np.full(1000, i, dtype=float) for i, name in enumerate("abc")}
+        cache.store("a", arrays["a"])
+        entry_size = cache._path("a").stat().st_size
+
+        # Room for two entries
+        cache.max_bytes = 2 * entry_size
+        cache.store("b", arrays["b"])
+        os.utime(cache._path("a"), (1, 1))
+        os.utime(cache._path("b"), (2, 2))
+
+        # Reading "a" makes "b" the least recently used entry
+        assert np.array_equal(cache.load("a"), arrays["a"])
+        cache.store("c", arrays["c"])
+        assert cache.load("b") is None
+        assert np.array_equal(cache.load("a"), arrays["a"])
+        assert np.array_equal(cache.load("c"), arrays["c"])
+
+        # An entry larger than the whole budget is not kept
+        cache.store("d", np.zeros(3000))
+        assert cache.load("d") is None
+
+
+def test_masked_round_trip():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ResultCache(cache_dir)
+        values = np.ma.masked_array(np.arange(12.0).reshape(3, 4), np.eye(3, 4) > 0)
+        cache.store("masked", values)
+        loaded = cache.load("masked")
+        assert np.array_equal(loaded.mask, values.mask)
+        assert np.array_equal(loaded.data, values.data)
+
+
+if __name__ == "__main__":
+    test_mask_shape_in_key()
+    test_least_recently_used_evicted()
+    test_masked_round_trip()
+    print("OK")
@@ -0,0 +1,47 @@
+from functools import partial
+
+import numpy as np
+from skimage.io import imread
+from skimage.morphology import medial_axis
+
+from backbone import create_graph_from_skeleton
+from pointutils import IndexPoint
+
+
+def check_segments(graph, segments):
+    # Every segment runs from its source node to its destination node, and
+    # its edge weighs as much as the steps along it
+    n_segments = 0
+    for src, by_dst in segments.items():
+        for dst, segment in by_dst.items():
+            n_segments += 1
+            assert src in graph and dst in graph
+            assert IndexPoint(tuple(segment[0])) == src
+            assert IndexPoint(tuple(segment[-1])) == dst
+            steps = np.hypot(*np.diff(segment, axis=0).T)
+            assert np.isclose(graph[src][dst]["weight"], steps.sum())
+    assert n_segments == graph.number_of_edges()
+
+
+def test_medial_axis_graph():
+    image = imread("data/05_bend.png")[:, :, 0]
+    skeleton = partial(medial_axis, rng=0)(image)
+    check_segments(*create_graph_from_skeleton(skeleton))
+
+
+def test_single_pixel_segments():
+    # Every segment of these skeletons is a single pixel between two ends
+    for skeleton, weight in [
+        (np.ones((1, 3), dtype=bool), 2.0),
+        (np.eye(3, dtype=bool), 2 * np.sqrt(2)),
+    ]:
+        graph, segments = create_graph_from_skeleton(np.pad(skeleton, 1))
+        check_segments(graph, segments)
+        assert graph.number_of_nodes() == 2
+        assert [w for _, _, w in graph.edges(data="weight")] == [weight]
+
+
+if __name__ == "__main__":
+    test_medial_axis_graph()
+    test_single_pixel_segments()
+    print("OK")
@@ -0,0 +1,50 @@
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from skimage.draw import disk
+from skimage.io import imsave
+
+from stream_images import image_paths, output_name, stream_images
+
+NAMES = ["x.png", "x.tif", "a/x.png", "a/b/y.png", "a/b/notes.txt"]
+
+
+def make_masks(root):
+    image = np.zeros((40, 60), dtype=np.uint8)
+    image[disk((20, 25), 12)] = 255
+    image[15:25, 25:55] = 255
+    for name in NAMES:
+        path = Path(root) / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix == ".txt":
+            path.write_text("not an image")
+        else:
+            imsave(path, image, check_contrast=False)
+
+
+def test_image_paths_and_names():
+    # Subdirectories are searched, and no two images share an output name
+    with tempfile.TemporaryDirectory() as root:
+        make_masks(root)
+        names = sorted(output_name(path, root) for path in image_paths(root))
+        assert names == sorted(name for name in NAMES if not name.endswith(".txt"))
+
+
+def test_stream_images():
+    with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as out:
+        make_masks(root)
+        results = list(stream_images(root, out, max_workers=1))
+        assert len(results) == 4 and all(error is None for _, _, error in results)
+        for name in ["x.png", "x.tif", "a/x.png", "a/b/y.png"]:
+            assert (Path(out) / f"{name}.json").exists(), name
+            assert (Path(out) / f"{name}.npz").exists(), name
+
+        # Done images are skipped
+        assert list(stream_images(root, out, max_workers=1)) == []
+
+
+if __name__ == "__main__":
+    test_image_paths_and_names()
+    test_stream_images()
+    print("OK")
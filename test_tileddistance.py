@@ -0,0 +1,46 @@
+import numpy as np
+import skfmm
+from skimage.io import imread
+
+from fmmdistance import distance_from_edge, distance_from_seed_set
+from tileddistance import tiled_distance_from_edge, tiled_distance_from_seed_set
+
+FIXTURES = ["01_blob", "04_crescent", "05_bend"]
+
+
+def test_tiled_distance_from_seed_set():
+    # Small tiles, so that the distances cross many tile borders
+    for name in FIXTURES:
+        image = imread(f"data/{name}.png")[:, :, 0] > 0
+        seed = np.unravel_index(np.argmax(distance_from_edge(image)), image.shape)
+        expected = distance_from_seed_set(image, [seed])
+        tiled = tiled_distance_from_seed_set(
+            image, [seed], np.empty(image.shape), tile_size=32, overlap=8
+        )
+        assert np.array_equal(np.isnan(tiled), np.ma.getmaskarray(expected)), name
+        assert (
+            np.nanmax(np.abs(tiled - expected.filled(np.nan))) < 0.03 * expected.max()
+        )
+
+        # The same first order scheme as skfmm at order=1
+        phi = np.ones(image.shape)
+        phi[seed] = -1
+        first_order = skfmm.distance(np.ma.masked_array(phi, ~image), order=1)
+        assert np.nanmax(np.abs(tiled - first_order.filled(np.nan))) < 1e-8, name
+
+
+def test_tiled_distance_from_edge():
+    for name in FIXTURES:
+        image = imread(f"data/{name}.png")[:, :, 0] > 0
+        tiled = tiled_distance_from_edge(
+            image, np.empty(image.shape), tile_size=32, overlap=8
+        )
+        assert np.abs(tiled - distance_from_edge(image)).max() < 1.5, name
+        first_order = skfmm.distance(np.where(image, 1.0, -1.0), order=1)
+        assert np.abs(tiled - first_order).max() < 1e-8, name
+
+
+if __name__ == "__main__":
+    test_tiled_distance_from_seed_set()
+    test_tiled_distance_from_edge()
+    print("OK")
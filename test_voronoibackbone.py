@@ -0,0 +1,62 @@
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from intrabody import intrabody_fields
+from rasterize import grid_from_bounds, rasterize
+from voronoibackbone import backbone_pixels, voronoi_backbone
+
+WORLD_FILE = "./data/ne_110m_admin_0_countries/ne_110m_admin_0_countries.shp"
+
+
+def fields_of(geometry, grid):
+    image = rasterize(geometry, grid)
+    pixels = backbone_pixels(voronoi_backbone(geometry), grid, image)
+    return intrabody_fields(image, backbone_pixels=pixels, max_workers=1)
+
+
+def test_thin_shape():
+    # Pixels of size 1, with centers at integer coordinates
+    grid = grid_from_bounds((0, -10, 100, 10), 21, 101)
+
+    # Three pixels wide: the backbone runs along the whole shape
+    fields = fields_of(shapely.box(0, 0.2, 100, 3.2), grid)
+    assert np.ptp(fields.backbone[:, 1]) >= 95
+
+    # One pixel wide: nothing is left to march the distance from the backbone to
+    try:
+        fields_of(shapely.box(0, 0.2, 100, 1.2), grid)
+    except ValueError as exc:
+        assert "one pixel wide" in str(exc)
+    else:
+        raise AssertionError("no error for a shape one pixel wide")
+
+    # Between the rows of pixel centers: no backbone pixel at all
+    try:
+        fields_of(shapely.box(0, 0.2, 100, 0.7), grid)
+    except ValueError as exc:
+        assert "too thin" in str(exc)
+    else:
+        raise AssertionError("no error for a shape thinner than a pixel")
+
+
+def test_countries():
+    # N. Cyprus ends in a pixel joined to the rest by a corner, and Fiji is
+    # a few slivers on either side of the antimeridian
+    world = gpd.read_file(WORLD_FILE)
+    for name in ["N. Cyprus", "Fiji"]:
+        geometry = world.loc[world["NAME"] == name].union_all()
+        grid = grid_from_bounds(geometry.bounds, 128, 128)
+        try:
+            fields = fields_of(geometry, grid)
+        except ValueError as exc:
+            assert name == "Fiji" and "too thin" in str(exc), name
+        else:
+            assert name == "N. Cyprus"
+            assert np.nanmax(fields.distality) > 0.99
+
+
+if __name__ == "__main__":
+    test_thin_shape()
+    test_countries()
+    print("OK")
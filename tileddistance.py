@@ -0,0 +1,363 @@
+# Compute distance fields of rasters that do not fit in memory, tile by tile on memory-mapped arrays
+
+from pathlib import Path
+
+import numpy as np
+
+from pointutils import index_array
+
+# Number of rows and columns in the core of a tile
+TILE_SIZE = 1024
+
+# Number of pixels of the neighboring tiles that are read around the core of
+# a tile. A wider overlap lets distances travel further per solve, so fewer
+# tiles have to be solved again.
+TILE_OVERLAP = 32
+
+
+def tiled_distance_from_edge(
+    image,
+    output,
+    tile_size=TILE_SIZE,
+    overlap=TILE_OVERLAP,
+    tolerance=1e-9,
+    dtype=float,
+):
+    """
+    Compute the distance transform of a binary image, one tile at a time.
+
+    The result is the same signed distance as distance_from_edge, positive
+    inside and negative outside the object, computed with a first order
+    scheme: it agrees with skfmm.distance at order=1 to about 1e-10, and
+    differs from the second order distances of distance_from_edge by up to
+    about 1.5 pixels. Only the tile being solved and its overlap are held in
+    memory, so the image and the output can be memory-mapped files larger
+    than RAM.
+
+    Parameters
+    ----------
+    image : array_like
+        Binary image, for example a numpy.memmap.
+    output : str, Path or ndarray
+        Path of a .npy file to create, or a writable float array with the
+        same shape as the image, for example a numpy.memmap.
+    tile_size : int
+        Number of rows and columns in the core of a tile.
+    overlap : int
+        Number of pixels read around the core of each tile.
+    tolerance : float
+        Smallest change of a distance that causes the neighboring tiles to be
+        solved again, on top of the rounding error of the output type.
+    dtype : data-type, optional
+        Floating point type of the output file, if a path is given. Each
+        tile is solved in double precision.
+
+    Returns
+    -------
+    distance : ndarray
+        The output array, holding the distance transform of the image.
+    """
+
+    def phi(rows, cols):
+        inside = np.asarray(image[rows, cols]) > 0
+        return np.where(inside, 1.0, -1.0)
+
+    return _tiled_distance(
+        phi,
+        image.shape,
+        _open_output(output, image.shape, dtype),
+        tile_size,
+        overlap,
+        tolerance,
+    )
+
+
+def tiled_distance_from_seed_set(
+    image,
+    seed_set,
+    output,
+    tile_size=TILE_SIZE,
+    overlap=TILE_OVERLAP,
+    tolerance=1e-9,
+    dtype=float,
+):
+    """
+    Compute the distance transform of a binary image from a set of pixels,
+    one tile at a time.
+
+    The result is the same distance as distance_from_seed_set, computed with
+    a first order scheme: it agrees with skfmm.distance at order=1 to about
+    1e-10, and differs from the second order distances of
+    distance_from_seed_set by up to about 3% of the largest distance.
+    Pixels outside the object, and pixels that cannot be reached from the
+    seed set, are NaN.
+
+    Parameters
+    ----------
+    image : array_like
+        Binary image, for example a numpy.memmap.
+    seed_set : ndarray or sequence
+        Integer array of shape (N, 2) holding the (i, j) coordinates of the
+        seed pixels, or sequence of (i, j) tuples.
+    output : str, Path or ndarray
+        Path of a .npy file to create, or a writable float array with the
+        same shape as the image, for example a numpy.memmap.
+    tile_size : int
+        Number of rows and columns in the core of a tile.
+    overlap : int
+        Number of pixels read around the core of each tile.
+    tolerance : float
+        Smallest change of a distance that causes the neighboring tiles to be
+        solved again, on top of the rounding error of the output type.
+    dtype : data-type, optional
+        Floating point type of the output file, if a path is given. Each
+        tile is solved in double precision.
+
+    Returns
+    -------
+    distance : ndarray
+        The output array, holding the distance transform of the image from
+        the given pixels.
+    """
+    seeds = index_array(seed_set)
+    if not np.any(np.asarray(image[seeds[:, 0], seeds[:, 1]]) > 0):
+        raise ValueError(
+            "The seed set must contain at least one pixel inside the object."
+        )
+
+    def phi(rows, cols):
+        inside = np.asarray(image[rows, cols]) > 0
+        values = np.where(inside, 1.0, np.nan)
+        in_tile = (
+            (seeds[:, 0] >= rows.start)
+            & (seeds[:, 0] < rows.stop)
+            & (seeds[:, 1] >= cols.start)
+            & (seeds[:, 1] < cols.stop)
+        )
+        values[seeds[in_tile, 0] - rows.start, seeds[in_tile, 1] - cols.start] = -1
+        values[~inside] = np.nan
+        return values
+
+    return _tiled_distance(
+        phi,
+        image.shape,
+        _open_output(output, image.shape, dtype),
+        tile_size,
+        overlap,
+        tolerance,
+    )
+
+
+def _tiled_distance(phi, shape, distance, tile_size, overlap, tolerance):
+    """
+    Solve the eikonal equation on a grid of tiles.
+
+    phi(rows, cols) gives the level set function of a window of the image:
+    the zero contour between positive and negative pixels is the front, and
+    NaN pixels are outside the domain. Every tile is solved with its overlap
+    read from the current output, and its core written back. The tiles next
+    to a tile whose core changed are solved again, until no tile changes.
+    """
+    overlap = max(int(overlap), 1)
+    n_tiles = [-(-size // tile_size) for size in shape]
+
+    def window(tile, margin):
+        return tuple(
+            slice(
+                max(index * tile_size - margin, 0),
+                min((index + 1) * tile_size + margin, size),
+            )
+            for index, size in zip(tile, shape)
+        )
+
+    # Start from the distances of the pixels next to the front
+    tiles = [(ti, tj) for ti in range(n_tiles[0]) for tj in range(n_tiles[1])]
+    for tile in tiles:
+        core = window(tile, 0)
+        distance[core] = _crop_to(_initial_distance(phi(*window(tile, 1))), 1, core)
+
+    dirty = set(tiles)
+    while dirty:
+        for tile in sorted(dirty):
+            if tile not in dirty:
+                continue
+            dirty.discard(tile)
+
+            extended = window(tile, overlap)
+            core = window(tile, 0)
+            frozen = np.isfinite(_initial_distance(phi(*window(tile, overlap + 1))))
+            frozen = _crop_to(frozen, 1, extended)
+
+            values = np.array(distance[extended], dtype=float)
+            solved = _solve(values, frozen)
+
+            offset = (
+                core[0].start - extended[0].start,
+                core[1].start - extended[1].start,
+            )
+            old_core = values[_local(core, offset)]
+            new_core = solved[_local(core, offset)]
+            # Changes within the rounding error of the output type are not
+            # changes, or float32 outputs never stop
+            slack = tolerance + 4 * np.finfo(distance.dtype).eps * np.abs(
+                np.where(np.isfinite(old_core), old_core, 0)
+            )
+            if np.any(new_core < old_core - slack):
+                distance[core] = new_core
+                ti, tj = tile
+                dirty.update(
+                    (ti + di, tj + dj)
+                    for di in (-1, 0, 1)
+                    for dj in (-1, 0, 1)
+                    if (di or dj)
+                    and 0 <= ti + di < n_tiles[0]
+                    and 0 <= tj + dj < n_tiles[1]
+                )
+
+    # Give the distances the sign of the level set function
+    for tile in tiles:
+        core = window(tile, 0)
+        sign = phi(*core)
+        values = np.array(distance[core], dtype=float)
+        values[~np.isfinite(values) | np.isnan(sign)] = np.nan
+        distance[core] = np.copysign(values, sign)
+
+    if isinstance(distance, np.memmap):
+        distance.flush()
+    return distance
+
+
+def _open_output(output, shape, dtype):
+    """
+    Create the output .npy file, or check the shape of the output array.
+    """
+    if isinstance(output, (str, Path)):
+        return np.lib.format.open_memmap(output, mode="w+", dtype=dtype, shape=shape)
+    if output.shape != tuple(shape):
+        raise ValueError("The output must have the same shape as the image.")
+    return output
+
+
+def _crop_to(values, margin, bounds):
+    """
+    Remove the margin that was read around a window, except where the window
+    touches the edge of the image.
+    """
+    top = margin if bounds[0].start > 0 else 0
+    left = margin if bounds[1].start > 0 else 0
+    height = bounds[0].stop - bounds[0].start
+    width = bounds[1].stop - bounds[1].start
+    return values[top : top + height, left : left + width]
+
+
+def _local(bounds, offset):
+    """
+    Convert the slices of a window to the coordinates of a larger window.
+    """
+    return tuple(
+        slice(start, start + box.stop - box.start) for box, start in zip(bounds, offset)
+    )
+
+
+def _initial_distance(phi):
+    """
+    Compute the distance to the front of the pixels next to it, as the fast
+    marching method does. All other pixels are infinitely far away.
+
+    A pixel is next to the front if a 4-neighbor has the opposite sign. The
+    front is halfway between the two pixels along each such axis.
+    """
+    valid = ~np.isnan(phi)
+    positive = np.where(valid, phi > 0, False)
+    crossed_axes = np.zeros(phi.shape, dtype=np.intp)
+
+    for axis in range(2):
+        crosses = np.zeros(phi.shape, dtype=bool)
+        before = [slice(None)] * 2
+        after = [slice(None)] * 2
+        before[axis] = slice(None, -1)
+        after[axis] = slice(1, None)
+        before, after = tuple(before), tuple(after)
+        edge = valid[before] & valid[after] & (positive[before] != positive[after])
+        crosses[before] |= edge
+        crosses[after] |= edge
+        crossed_axes += crosses
+
+    distance = np.full(phi.shape, np.inf)
+    front = crossed_axes > 0
+    distance[front] = 0.5 / np.sqrt(crossed_axes[front])
+    distance[~valid] = np.nan
+    return distance
+
+
+def _solve(distance, frozen):
+    """
+    Solve the eikonal equation in a window with the first order upwind
+    scheme.
+
+    As in the fast marching method, the pixels are settled in the order of
+    their distance, but in groups, which numpy updates at once: every pixel
+    whose tentative distance is within 1/sqrt(2) of the smallest one, the
+    least that a distance grows from one pixel to the next. A pixel that
+    improves later goes back into the band, so distances that are already
+    in the window, from an earlier solve, are only lowered where the
+    neighboring tiles brought shorter paths, and the rest of the window is
+    not visited again. Frozen pixels and NaN pixels keep their values.
+    """
+    height, width = distance.shape[0] + 2, distance.shape[1] + 2
+    padded = np.full((height, width), np.inf)
+    padded[1:-1, 1:-1] = np.where(np.isnan(distance), np.inf, distance)
+    grid = padded.ravel()
+
+    free = np.zeros((height, width), dtype=bool)
+    free[1:-1, 1:-1] = ~frozen & ~np.isnan(distance)
+    free = free.ravel()
+
+    # Flat offsets of the 4-neighbors
+    steps = np.array([-width, width, -1, 1])
+    in_band = np.zeros(grid.size, dtype=bool)
+    position = np.zeros(grid.size, dtype=np.intp)
+
+    def improve(index, band):
+        # Lower the distances of the given pixels that their neighbors
+        # improve, and add them to the band
+        index = index[free[index]]
+        updated = _update(grid, index, width)
+        better = updated < grid[index]
+        index = index[better]
+        grid[index] = updated[better]
+        index = index[~in_band[index]]
+        # Keep one copy of each pixel, without sorting
+        position[index] = np.arange(len(index))
+        index = index[position[index] == np.arange(len(index))]
+        in_band[index] = True
+        return np.concatenate([band, index])
+
+    with np.errstate(invalid="ignore"):
+        band = improve(np.flatnonzero(free), np.empty(0, dtype=np.intp))
+        while len(band):
+            values = grid[band]
+            in_group = values < values.min() + np.sqrt(0.5)
+            group, band = band[in_group], band[~in_group]
+            in_band[group] = False
+            band = improve((group[:, None] + steps).ravel(), band)
+
+    result = padded[1:-1, 1:-1]
+    result[np.isnan(distance)] = np.nan
+    return result
+
+
+def _update(grid, index, width):
+    """
+    Compute the distances of pixels of a flattened padded grid from their
+    4-neighbors with the first order upwind scheme.
+    """
+    a = np.minimum(grid[index - width], grid[index + width])
+    b = np.minimum(grid[index - 1], grid[index + 1])
+    low = np.minimum(a, b)
+    difference = np.maximum(a, b) - low
+    return np.where(
+        difference < 1,
+        (2 * low + difference + np.sqrt(2 - difference**2)) / 2,
+        low + 1,
+    )
@@ -0,0 +1,215 @@
+# Find the backbone of a polygon from a Voronoi diagram of its boundary, without rasterizing it
+
+import numpy as np
+import shapely
+from scipy.sparse import coo_matrix
+from scipy.spatial import Voronoi
+
+from backbone import extension_direction, longest_path_indices, trim_corner_ends
+from profiling import stage
+from rasterize import world_to_pixel
+
+# Default number of points the boundary is sampled at
+BOUNDARY_POINTS = 2000
+
+
+def voronoi_backbone(geometry, spacing=None, k=10):
+    """
+    Find the backbone of a polygon directly from its rings.
+
+    The boundary is sampled at regular intervals, and the edges of the
+    Voronoi diagram of the samples that lie inside the polygon form an
+    approximate medial axis. The longest path along these edges is extended
+    along straight rays to the boundary, as in backbone.extend_to_boundary.
+    The cost grows with the number of boundary samples, not with the area
+    of the polygon.
+
+    Parameters
+    ----------
+    geometry : shapely.Geometry
+        Polygon or multipolygon. For a multipolygon, the backbone of the
+        part with the longest medial axis path is returned.
+    spacing : float, optional
+        Largest distance between consecutive boundary samples, in the units
+        of the coordinates. The medial axis is accurate to about this
+        distance. Defaults to the length of the boundary divided by
+        BOUNDARY_POINTS.
+    k : int, optional
+        Number of path points, spaced by the sampling distance, to use for
+        estimating the direction of the path at the boundary.
+
+    Returns
+    -------
+    backbone : ndarray
+        Array of shape (N, 2) holding the (x, y) coordinates of the points
+        along the backbone, from one end on the boundary to the other.
+    """
+    if spacing is None:
+        spacing = geometry.length / BOUNDARY_POINTS
+    if not spacing > 0:
+        raise ValueError("The geometry must have a boundary of positive length")
+
+    with stage("voronoi_backbone") as counts:
+        coordinates, edges = voronoi_medial_axis(geometry, spacing)
+        if len(edges) == 0:
+            raise ValueError("The medial axis must contain at least one edge")
+
+        lengths = np.hypot(*(coordinates[edges[:, 1]] - coordinates[edges[:, 0]]).T)
+        sparse_graph = coo_matrix(
+            (lengths, (edges[:, 0], edges[:, 1])),
+            shape=(len(coordinates), len(coordinates)),
+        ).tocsr()
+        path = coordinates[longest_path_indices(sparse_graph, len(edges))]
+
+        start = _extend_to_polygon_boundary(path[::-1], geometry, spacing, k)
+        end = _extend_to_polygon_boundary(path, geometry, spacing, k)
+        backbone = np.vstack([start, path, end])
+
+        if counts is not None:
+            counts["medial_axis_edges"] = len(edges)
+            counts["backbone_points"] = len(backbone)
+
+    return backbone
+
+
+def voronoi_medial_axis(geometry, spacing):
+    """
+    Approximate the medial axis of a polygon by the Voronoi edges of its
+    boundary samples that lie inside it.
+
+    Parameters
+    ----------
+    geometry : shapely.Geometry
+        Polygon or multipolygon.
+    spacing : float
+        Largest distance between consecutive boundary samples.
+
+    Returns
+    -------
+    coordinates : ndarray
+        Array of shape (M, 2) holding the (x, y) coordinates of the vertices
+        of the medial axis.
+    edges : ndarray
+        Array of shape (E, 2) holding the indices of the two vertices of
+        every edge of the medial axis. Every edge is listed once.
+    """
+    rings = shapely.get_rings(shapely.get_parts(shapely.segmentize(geometry, spacing)))
+    samples = np.unique(shapely.get_coordinates(rings), axis=0)
+    voronoi = Voronoi(samples)
+
+    # Keep the finite ridges whose vertices are inside the polygon, and that
+    # do not cross its boundary in between
+    ridges = np.array(voronoi.ridge_vertices, dtype=np.intp).reshape(-1, 2)
+    ridges = ridges[np.all(ridges >= 0, axis=1)]
+    shapely.prepare(geometry)
+    inside = shapely.contains_xy(geometry, *voronoi.vertices.T)
+    ridges = ridges[inside[ridges[:, 0]] & inside[ridges[:, 1]]]
+    lines = shapely.linestrings(voronoi.vertices[ridges])
+    ridges = ridges[shapely.within(lines, geometry)]
+
+    # Number the vertices that are used by the kept ridges
+    used, edges = np.unique(ridges, return_inverse=True)
+    coordinates = voronoi.vertices[used]
+    edges = np.sort(edges.reshape(-1, 2), axis=1)
+    edges = np.unique(edges[edges[:, 0] != edges[:, 1]], axis=0)
+
+    return coordinates, edges
+
+
+def _extend_to_polygon_boundary(path, geometry, spacing, k):
+    """
+    Find the point where a straight ray from the last point of a path, in
+    the direction the path leaves it, meets the boundary of the polygon.
+
+    Returns an array of shape (1, 2) holding the point, or of shape (0, 2)
+    if the direction cannot be estimated.
+    """
+    line = shapely.LineString(path) if len(path) > 1 else None
+    if line is None or line.length == 0:
+        return np.empty((0, 2))
+
+    # Points at regular intervals along the end of the path, ending at its last point
+    distances = np.maximum(line.length - np.arange(k)[::-1] * spacing, 0)
+    points = shapely.get_coordinates(shapely.line_interpolate_point(line, distances))
+    direction = extension_direction(points)
+    norm = np.hypot(*direction)
+    if norm == 0:
+        return np.empty((0, 2))
+
+    # The ray is long enough to leave the polygon
+    minx, miny, maxx, maxy = geometry.bounds
+    reach = 2 * np.hypot(maxx - minx, maxy - miny)
+    ray = shapely.LineString([path[-1], path[-1] + direction / norm * reach])
+    crossings = shapely.get_coordinates(shapely.intersection(ray, geometry.boundary))
+    if len(crossings) == 0:
+        return np.empty((0, 2))
+
+    nearest = np.argmin(np.hypot(*(crossings - path[-1]).T))
+    return crossings[[nearest]]
+
+
+def backbone_pixels(backbone, grid, image=None):
+    """
+    Convert a backbone in polygon coordinates to pixels of a raster grid,
+    for use as the seed set of the distance fields.
+
+    The backbone is sampled at least every half pixel, and every sample is
+    assigned to the pixel whose center is closest.
+
+    Parameters
+    ----------
+    backbone : ndarray
+        Array of shape (N, 2) holding the (x, y) coordinates of the points
+        along the backbone, such as the result of voronoi_backbone.
+    grid : RasterGrid
+        Grid of pixel centers.
+    image : ndarray, optional
+        Binary image on the grid. If given, only foreground pixels are kept,
+        and the pixels at either end that touch the foreground only by their
+        corners are left out, as in backbone.trim_corner_ends. If none is
+        kept, as for a polygon that is thin or small compared to the pixels,
+        a ValueError is raised.
+
+    Returns
+    -------
+    pixels : ndarray
+        Integer array of shape (N, 2) holding the (i, j) coordinates of the
+        pixels along the backbone, in order and without consecutive repeats.
+    """
+    backbone = np.asarray(backbone, dtype=float).reshape(-1, 2)
+    points = np.column_stack(world_to_pixel(backbone[:, 0], backbone[:, 1], grid))
+
+    # Sample every segment at half pixel steps
+    segments = np.diff(points, axis=0)
+    steps = np.maximum(np.ceil(2 * np.hypot(*segments.T)).astype(np.intp), 1)
+    segment = np.repeat(np.arange(len(steps)), steps)
+    t = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / steps[
+        segment
+    ]
+    samples = np.vstack(
+        [points[segment] + t[:, np.newaxis] * segments[segment], points[-1:]]
+    )
+
+    pixels = np.floor(samples + 0.5).astype(np.intp)
+    keep = (
+        (pixels[:, 0] >= 0)
+        & (pixels[:, 0] < grid.nrows)
+        & (pixels[:, 1] >= 0)
+        & (pixels[:, 1] < grid.ncols)
+    )
+    pixels = pixels[keep]
+    if image is not None:
+        pixels = pixels[np.asarray(image)[pixels[:, 0], pixels[:, 1]] != 0]
+
+    changes = np.ones(len(pixels), dtype=bool)
+    changes[1:] = np.any(pixels[1:] != pixels[:-1], axis=1)
+    pixels = pixels[changes]
+
+    if image is not None:
+        if len(pixels) == 0:
+            raise ValueError(
+                "The backbone does not cross the foreground of the image. The "
+                "polygon may be too thin or too small for the grid."
+            )
+        pixels = trim_corner_ends(pixels, image)
+    return pixels